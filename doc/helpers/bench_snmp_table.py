@@ -0,0 +1,247 @@
+#!/usr/bin/python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2012             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# ails.  You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+
+# Benchmark for the assembly of SNMP tables in modules/snmp.py. It
+# builds synthetic walks with gaps and compares get_snmp_table() with
+# the implementation used up to 1.2.0p2 (copied below). Both must
+# produce exactly the same output. Note: the old implementation is
+# quadratic and needs several minutes for 50000 rows.
+#
+# Usage: bench_snmp_table.py [NUMROWS]
+
+import sys, os, time
+
+numrows = 50000
+if len(sys.argv) > 1:
+    numrows = int(sys.argv[1])
+
+class MKGeneralException(Exception):
+    pass
+
+opt_use_snmp_walk = False
+opt_debug = False
+
+def is_usewalk_host(hostname):
+    return False
+
+execfile(os.path.dirname(os.path.abspath(__file__)) + "/../../modules/snmp.py")
+
+# Synthetic walks: column 1 is complete, column 2 misses every 7th
+# row, column 3 every 3rd row and column 4 only has the second half.
+# Indices are two-level end-oids, so string sort and numeric sort
+# differ (1.14 must come after 1.2).
+baseoid = ".1.3.6.1.2.1.99.1.1"
+indices = [ "%d.%d" % (n / 100 + 1, n % 100 + 1) for n in range(numrows) ]
+
+def make_walk(column):
+    walk = []
+    for n, index in enumerate(indices):
+        if column == 2 and n % 7 == 3:
+            continue
+        elif column == 3 and n % 3 == 1:
+            continue
+        elif column == 4 and n < numrows / 2:
+            continue
+        walk.append(("%s.%d.%s" % (baseoid, column, index), "value-%d-%d" % (column, n)))
+    return walk
+
+walks = dict([ ("%s.%d" % (baseoid, c), make_walk(c)) for c in [ 1, 2, 3, 4 ]])
+
+# Replaces the real function from snmp.py
+def snmpwalk_on_suboid(hostname, ip, oid):
+    return list(walks.get(oid, []))
+
+oid_infos = [
+    ( baseoid, [ OID_END, 1, 2, 3, 4 ] ),
+    ( baseoid, [ 4, 3, OID_STRING, 2 ] ),
+    ( ".1.3.6.1.2.1.99.1", [ 1 ], [ OID_END, 2, 4 ] ),
+]
+
+# get_snmp_table() as of 1.2.0p2
+def old_get_snmp_table(hostname, ip, oid_info):
+    # oid_info is either ( oid, columns ) or
+    # ( oid, suboids, columns )
+    # suboids is a list if OID-infixes that are put between baseoid
+    # and the columns and also prefixed to the index column. This
+    # allows to merge distinct SNMP subtrees with a similar structure
+    # to one virtual new tree (look into cmctc_temp for an example)
+    if len(oid_info) == 2:
+        oid, targetcolumns = oid_info
+        suboids = [None]
+    else:
+        oid, suboids, targetcolumns = oid_info
+
+    if not oid.startswith("."):
+        raise MKGeneralException("OID definition '%s' does not begin with ." % oid)
+
+    all_values = []
+    index_column = -1
+    index_format = None
+    number_rows = -1
+    info = []
+    for suboid in suboids:
+        colno = -1
+        columns = []
+        # Detect missing (empty columns)
+        max_len = 0
+        max_len_col = -1
+
+        for column in targetcolumns:
+            fetchoid = oid
+            if suboid:
+                fetchoid += "." + str(suboid)
+            if column != "":
+                fetchoid += "." + str(column)
+
+            # column may be integer or string like "1.5.4.2.3"
+            colno += 1
+            # if column is 0, we do not fetch any data from snmp, but use
+            # a running counter as index. If the index column is the first one,
+            # we do not know the number of entries right now. We need to fill
+            # in later. If the column in OID_STRING or OID_BIN we do something
+            # similar: we fill in the complete OID of the entry, either as
+            # string or as binary UTF-8 encoded number string
+            if column in [ OID_END, OID_STRING, OID_BIN ]:
+                index_column = colno
+                columns.append((fetchoid, []))
+                index_format = column
+                continue
+
+
+            if opt_use_snmp_walk or is_usewalk_host(hostname):
+                rowinfo = get_stored_snmpwalk(hostname, fetchoid)
+            else:
+                rowinfo = snmpwalk_on_suboid(hostname, ip, fetchoid)
+
+            columns.append((fetchoid, rowinfo))
+            number_rows = len(rowinfo)
+            if len(rowinfo) > max_len:
+                max_len = len(rowinfo)
+                max_len_col = colno
+
+        if index_column != -1:
+            index_rows = []
+            # Take end-oids of non-index columns as indices
+            fetchoid, max_column  = columns[max_len_col]
+            for o, value in max_column:
+                if index_format == OID_END:
+                    eo = extract_end_oid(fetchoid, o)
+                    index_rows.append((o, eo))
+                elif index_format == OID_STRING:
+                    index_rows.append((o, o))
+                else:
+                    index_rows.append((o, oid_to_bin(o)))
+            columns[index_column] = fetchoid, index_rows
+
+
+        # prepend suboid to first column
+        if suboid and len(columns) > 0:
+            fetchoid, first_column = columns[0]
+            new_first_column = []
+            for o, val in first_column:
+                new_first_column.append((o, str(suboid) + "." + str(val)))
+            columns[0] = fetchoid, new_first_column
+
+        # Swap X and Y axis of table (we want one list of columns per item)
+        # Here we have to deal with a nasty problem: Some brain-dead devices
+        # omit entries in some sub OIDs. This happens e.g. for CISCO 3650
+        # in the interfaces MIB with 64 bit counters. So we need to look at
+        # the OIDs and watch out for gaps we need to fill with dummy values.
+
+        # First compute the complete list of end-oids appearing in the output
+        # by looping all results and putting the endoids to a flat list
+        endoids = []
+        for fetchoid, column in columns:
+            for o, value in column:
+                endoid = extract_end_oid(fetchoid, o)
+                if endoid not in endoids:
+                    endoids.append(endoid)
+
+        # The list needs to be sorted to prevent problems when the first
+        # column has missing values in the middle of the tree. Since we
+        # work with strings of numerical components, a simple string sort
+        # is not correct. 1.14 must come after 1.2!
+        endoids.sort(cmp = cmp_oids)
+
+        # Now fill gaps in columns where some endois are missing
+        new_columns = []
+        for fetchoid, column in columns:
+            i = 0
+            new_column = []
+            # Loop all lines to fill holes in the middle of the list. All
+            # columns check the following lines for the correct endoid. If
+            # an endoid differs empty values are added until the hole is filled
+            for o, value in column:
+                eo = extract_end_oid(fetchoid, o)
+                if len(column) != len(endoids):
+                    while i < len(endoids) and endoids[i] != eo:
+                        new_column.append("") # (beginoid + '.' +endoids[i], "" ) )
+                        i += 1
+                new_column.append(value)
+                i += 1
+
+            # At the end check if trailing OIDs are missing
+            while i < len(endoids):
+                new_column.append("") # (beginoid + '.' +endoids[i], "") )
+                i += 1
+            new_columns.append(new_column)
+        columns = new_columns
+
+        # Now construct table by swapping X and Y
+        new_info = []
+        index = 0
+        if len(columns) > 0:
+            for item in columns[0]:
+                new_info.append([ c[index] for c in columns ])
+                index += 1
+            info += new_info
+
+    return info
+
+
+failed = False
+for oid_info in oid_infos:
+    sys.stdout.write("%-55s" % (oid_info,))
+    sys.stdout.flush()
+    before = time.time()
+    new_info = get_snmp_table("host", "127.0.0.1", oid_info)
+    new_time = time.time() - before
+    sys.stdout.write(" new: %7.3fs" % new_time)
+    sys.stdout.flush()
+
+    before = time.time()
+    old_info = old_get_snmp_table("host", "127.0.0.1", oid_info)
+    old_time = time.time() - before
+    sys.stdout.write(" old: %7.3fs" % old_time)
+
+    if new_info == old_info:
+        sys.stdout.write(" OK (%d rows)\n" % len(new_info))
+    else:
+        sys.stdout.write(" DIFFERENT OUTPUT!\n")
+        failed = True
+
+if failed:
+    sys.exit(1)
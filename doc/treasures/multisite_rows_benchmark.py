@@ -0,0 +1,115 @@
+#!/usr/bin/python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2012             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# ails.  You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+
+
+# Compares the two representations of the rows of a Multisite view with
+# a recorded livestatus response: one dictionary per row (as done until
+# 1.2.0p2) and Row objects, which share one column index.
+#
+# Record a response with column headers, for example:
+#
+#   lq "GET services
+#   Columns: host_name description state plugin_output last_check perf_data
+#   ColumnHeaders: on
+#   OutputFormat: python" > services.txt
+#
+# Then call: multisite_rows_benchmark.py services.txt [WEBDIR]
+#
+# WEBDIR is the directory htdocs of Multisite (default: the one of OMD).
+# Memory is measured as increase of the resident size (Linux only).
+# Like livestatus, the response must have one row per line.
+
+import os, sys, time
+
+def usage():
+    sys.stderr.write("Usage: %s RESPONSEFILE [WEBDIR]\n" % sys.argv[0])
+    sys.exit(1)
+
+def resident_mb():
+    return int(file("/proc/self/statm").read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576.0
+
+# Decodes the response line by line, so that no large temporary
+# objects distort the memory measurement
+def read_response(path):
+    lines = file(path).readlines()
+    lines[0] = lines[0][1:]
+    lines[-1] = lines[-1].rstrip()[:-1]
+    return [ eval(line.rstrip().rstrip(",")) for line in lines if line.strip() ]
+
+def build_dicts(columns, data):
+    return [ dict(zip(columns, row)) for row in data ]
+
+def build_rows(columns, data):
+    index = dict([ (c, i) for i, c in enumerate(columns) ])
+    return [ Row(index, row) for row in data ]
+
+# Runs the benchmark in a child process, so that each representation
+# starts with the same memory
+def benchmark(title, build):
+    pid = os.fork()
+    if pid:
+        os.waitpid(pid, 0)
+        return
+
+    data = [ [ "" ] + row for row in response[1:] ]
+    before = resident_mb()
+    start = time.time()
+    rows = build(columns, data)
+    build_time = time.time() - start
+    del data
+    memory = resident_mb() - before
+
+    # Painters access most of the columns of each row
+    start = time.time()
+    for row in rows:
+        for c in columns:
+            row[c]
+    access_time = time.time() - start
+
+    start = time.time()
+    rows.sort(lambda a, b: cmp(a[columns[1]], b[columns[1]]) or cmp(a[columns[2]], b[columns[2]]))
+    sort_time = time.time() - start
+
+    print "%-12s %8.3f %8.3f %8.3f %8.1f" % (title, build_time, access_time, sort_time, memory)
+    sys.stdout.flush()
+    os._exit(0)
+
+if len(sys.argv) not in [ 2, 3 ]:
+    usage()
+responsefile = sys.argv[1]
+if len(sys.argv) == 3:
+    webdir = sys.argv[2]
+else:
+    webdir = os.getenv("OMD_ROOT", "") + "/share/check_mk/web/htdocs"
+sys.path.insert(0, webdir)
+from lib import Row
+
+response = read_response(responsefile)
+columns = [ "site" ] + response[0]
+print "%d rows with %d columns" % (len(response) - 1, len(columns))
+print "%-12s %8s %8s %8s %8s" % ("", "build/s", "access/s", "sort/s", "MB")
+benchmark("dictionaries", build_dicts)
+benchmark("Row objects", build_rows)
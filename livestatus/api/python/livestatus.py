@@ -24,7 +24,7 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
-import socket, time
+import socket, time, select, errno
 
 # Python 2.3 does not have 'set' in normal namespace.
 # But it can be imported from 'sets'
@@ -47,6 +47,12 @@ For persistent connections create and keep an object:
 conn = connection("/var/lib/nagios/rw/live")
 r1 = conn.query_table_assoc("GET hosts")
 r2 = conn.query_row("GET status")
+
+Large results can be processed row by row while they are being
+received:
+
+for row in conn.query_iter("GET services\nColumns: host_name description"):
+    ...
 """
 
 # Keep a global array of persistant connections
@@ -159,6 +165,39 @@ class Helpers:
         return result
 
 
+# Decodes the body of a response in the python output format while it
+# is being received. Each row is on a line of its own, since livestatus
+# always escapes control characters in strings: "[row1,\nrow2,\n...rowN]\n".
+# All complete lines received so far are decoded at once.
+class RowDecoder:
+    def __init__(self):
+        self.pending = ""
+        self.first = True
+
+    # Returns the rows completed by data. last must be set for the
+    # final part of the body.
+    def decode(self, data, last = False):
+        self.pending += data
+        if not last:
+            end = self.pending.rfind("\n")
+            if end == -1:
+                return []
+            text = self.pending[:end]
+            self.pending = self.pending[end + 1:]
+        else:
+            text = self.pending.rstrip()[:-1] # closing bracket of the list
+            self.pending = ""
+        if self.first:
+            text = text[1:] # opening bracket of the list
+            self.first = False
+        if not text:
+            return []
+        try:
+            return eval("[" + text + "]")
+        except:
+            raise MKLivestatusSocketError("Malformed output")
+
+
 class BaseConnection:
     def __init__(self, socketurl, persist = False):
         """Create a new connection to a MK Livestatus socket"""
@@ -229,14 +268,70 @@ class BaseConnection:
             del persistent_connections[self.socketurl]
 
     def receive_data(self, size):
-        result = ""
+        result = []
         while size > 0:
-            packet = self.socket.recv(size)
+            packet = self.socket.recv(min(size, 65536))
             if len(packet) == 0:
                 raise MKLivestatusSocketClosed("Read zero data from socket, nagios server closed connection")
             size -= len(packet)
-            result += packet
-        return result
+            result.append(packet)
+        return "".join(result)
+
+    # Reads a response body of size bytes and returns the rows as soon
+    # as they have been received.
+    def receive_rows(self, size):
+        decoder = RowDecoder()
+        while size > 0:
+            packet = self.socket.recv(min(size, 65536))
+            if len(packet) == 0:
+                raise MKLivestatusSocketClosed("Read zero data from socket, nagios server closed connection")
+            size -= len(packet)
+            for row in decoder.decode(packet, size == 0):
+                yield row
+
+    # Non-blocking variant of recv_response() for reading the answers
+    # of several connections at the same time: start_response() is
+    # called after send_query(), then read_response_part() each time
+    # the socket is readable, until response_complete() is true. Each
+    # call returns the rows decoded from the data received.
+    def start_response(self):
+        self.response_header = ""
+        self.response_code = None
+        self.response_size = None
+        self.response_error = []
+        self.response_decoder = RowDecoder()
+
+    def response_complete(self):
+        return self.response_size == 0
+
+    def read_response_part(self):
+        if self.response_size == None:
+            packet = self.socket.recv(16 - len(self.response_header))
+            if len(packet) == 0:
+                raise MKLivestatusSocketClosed("Read zero data from socket, nagios server closed connection")
+            self.response_header += packet
+            if len(self.response_header) < 16:
+                return []
+            self.response_code = self.response_header[0:3]
+            try:
+                self.response_size = int(self.response_header[4:15].lstrip())
+            except:
+                raise MKLivestatusSocketError("Malformed output. Livestatus TCP socket might be unreachable.")
+            rows = []
+        else:
+            packet = self.socket.recv(min(self.response_size, 65536))
+            if len(packet) == 0:
+                raise MKLivestatusSocketClosed("Read zero data from socket, nagios server closed connection")
+            self.response_size -= len(packet)
+            if self.response_code == "200":
+                rows = self.response_decoder.decode(packet, self.response_size == 0)
+            else:
+                self.response_error.append(packet)
+                rows = []
+
+        if self.response_size == 0 and self.response_code != "200":
+            raise MKLivestatusQueryError(self.response_code, "".join(self.response_error).strip())
+        return rows
 
     def do_query(self, query, add_headers = ""):
         self.send_query(query, add_headers)
@@ -267,6 +362,14 @@ class BaseConnection:
     # by the livestatus server, we automatically make a reconnect and send
     # the query again (once). This is due to timeouts during keepalive.
     def recv_response(self, query = None, add_headers = ""):
+        return list(self.recv_response_iter(query, add_headers))
+
+    # Same as recv_response(), but returns the rows while they are being
+    # received. The query is only sent again, if the socket has been closed
+    # before the first row. The response must be read completely before
+    # the next query is sent over this connection.
+    def recv_response_iter(self, query = None, add_headers = ""):
+        rows_read = False
         try:
             resp = self.receive_data(16)
             code = resp[0:3]
@@ -274,20 +377,19 @@ class BaseConnection:
                 length = int(resp[4:15].lstrip())
             except:
                 raise MKLivestatusSocketError("Malformed output. Livestatus TCP socket might be unreachable.")
-            data = self.receive_data(length)
-            if code == "200":
-                try:
-                    return eval(data)
-                except:
-                    raise MKLivestatusSocketError("Malformed output")
-            else:
-                raise MKLivestatusQueryError(code, data.strip())
+            if code != "200":
+                raise MKLivestatusQueryError(code, self.receive_data(length).strip())
+            for row in self.receive_rows(length):
+                rows_read = True
+                yield row
+
         except MKLivestatusSocketClosed:
             self.disconnect()
-            if query:
+            if query and not rows_read:
                 self.connect()
                 self.send_query(query, add_headers)
-                return self.recv_response() # do not send query again -> danger of infinite loop
+                for row in self.recv_response_iter(): # do not send query again -> danger of infinite loop
+                    yield row
             else:
                 raise
 
@@ -319,6 +421,8 @@ class SingleSiteConnection(BaseConnection, Helpers):
         self.deadsites = {} # never filled, just for compatibility
         self.auth_header = ""
         self.limit = None
+        self.cache = None
+        self.cache_ttl = None
 
     def set_prepend_site(self, p):
         self.prepend_site = p
@@ -329,15 +433,51 @@ class SingleSiteConnection(BaseConnection, Helpers):
     def set_limit(self, limit = None):
         self.limit = limit
 
+    # Store for query results. It needs the methods get(sitename, query,
+    # auth_header, ttl), which returns None if there is no valid result,
+    # and put(sitename, query, auth_header, rows).
+    def set_cache(self, cache = None):
+        self.cache = cache
+
+    # Allow the following queries to be answered from the cache, if the
+    # result is not older than ttl seconds. None: do not use the cache
+    def set_cache_ttl(self, ttl = None):
+        self.cache_ttl = ttl
+
     def query(self, query, add_headers = ""):
         if self.limit != None:
             query += "Limit: %d\n" % self.limit
-        data = self.do_query(query, add_headers)
+        if self.cache and self.cache_ttl:
+            data = self.cache.get("", query + add_headers, self.auth_header, self.cache_ttl)
+            if data == None:
+                data = self.do_query(query, add_headers)
+                self.cache.put("", query + add_headers, self.auth_header, data)
+        else:
+            data = self.do_query(query, add_headers)
         if self.prepend_site:
             return [ [''] + line for line in data ]
         else:
             return data
 
+    def query_iter(self, query, add_headers = ""):
+        """Issues a query like query(), but returns an iterator over the
+           rows, which are available while the response is still being
+           received. The iterator must be exhausted before the connection
+           is used again."""
+        if self.cache and self.cache_ttl:
+            for line in self.query(query, add_headers):
+                yield line
+            return
+
+        if self.limit != None:
+            query += "Limit: %d\n" % self.limit
+        self.send_query(query, add_headers)
+        for line in self.recv_response_iter(query, add_headers):
+            if self.prepend_site:
+                yield [''] + line
+            else:
+                yield line
+
     def command(self, command, site = None):
         self.do_command(command)
 
@@ -371,6 +511,10 @@ class MultiSiteConnection(Helpers):
         self.only_sites = None
         self.limit = None
         self.parallelize = True
+        self.query_timeout = None
+        self.site_stats = {}
+        self.cache = None
+        self.cache_ttl = None
 
         # Helper function for connecting to a site
         def connect_to_site(sitename, site, temporary=False):
@@ -511,9 +655,26 @@ class MultiSiteConnection(Helpers):
     def set_limit(self, limit = None):
         self.limit = limit
 
+    # Store for query results, see SingleSiteConnection.set_cache()
+    def set_cache(self, cache = None):
+        self.cache = cache
+
+    def set_cache_ttl(self, ttl = None):
+        self.cache_ttl = ttl
+
+    # Overall time in seconds the sites have for answering a query. Sites
+    # that did not answer in time are regarded as dead. None: no limit
+    def set_query_timeout(self, timeout = None):
+        self.query_timeout = timeout
+
     def dead_sites(self):
         return self.deadsites
 
+    # Answer times of the sites: number of queries, total, last and maximum
+    # time in seconds and number of timeouts
+    def site_statistics(self):
+        return self.site_stats
+
     def alive_sites(self):
         return self.connections.keys()
 
@@ -569,52 +730,175 @@ class MultiSiteConnection(Helpers):
     # of Limit: since all sites are queried in parallel, the Limit: is simply
     # applied to all sites - resulting in possibly more results then Limit requests.
     def query_parallel(self, query, add_headers = ""):
+        answers = {}
+        for sitename, rows in self.receive_answers(query, add_headers):
+            answers.setdefault(sitename, []).extend(rows)
+
+        # Assemble the answers in the order of the sites, but
+        # drop incomplete answers of dead sites
+        result = []
+        for sitename, site, connection in self.connections:
+            if sitename in answers and sitename not in self.deadsites:
+                r = answers[sitename]
+                if self.prepend_site:
+                    r = [ [sitename] + l for l in r ]
+                result += r
+
+        self.connections = [ c for c in self.connections if c[0] not in self.deadsites ]
+        return result
+
+    # Sends the query to all active sites and then reads all answers at
+    # the same time, as the data arrives. Returns pairs of sitename and
+    # the rows received. Sites that fail or do not answer until the query
+    # timeout are put into self.deadsites.
+    def receive_answers(self, query, add_headers = ""):
         if self.only_sites != None:
             active_sites = [ c for c in self.connections if c[0] in self.only_sites ]
         else:
             active_sites = self.connections
 
+        if self.limit != None:
+            add_headers += "Limit: %d\n" % self.limit
+
+        # Take the answers from the cache where possible. The answers
+        # of the other sites are collected for the cache.
+        if self.cache and self.cache_ttl:
+            missing_sites = []
+            for sitename, site, connection in active_sites:
+                rows = self.cache.get(sitename, query + add_headers,
+                                      connection.auth_header, self.cache_ttl)
+                if rows == None:
+                    missing_sites.append((sitename, site, connection))
+                elif rows:
+                    yield sitename, rows
+            active_sites = missing_sites
+            cache_rows = {}
+        else:
+            cache_rows = None
+
         start_time = time.time()
-        stillalive = []
-        limit = self.limit
-        if limit != None:
-            limit_header = "Limit: %d\n" % limit
+        if self.query_timeout:
+            deadline = start_time + self.query_timeout
         else:
-            limit_header = ""
+            deadline = None
 
         # First send all queries
+        pending = {} # socket -> (sitename, site, connection, retried)
         for sitename, site, connection in active_sites:
             try:
-                connection.send_query(query, add_headers + limit_header)
+                connection.send_query(query, add_headers)
+                connection.start_response()
+                pending[connection.socket] = (sitename, site, connection, False)
             except Exception, e:
                 self.deadsites[sitename] = {
                     "exception" : e,
                     "site" : site,
                 }
 
-        # Then retrieve all answers. We will be as slow as the slowest of all
-        # connections.
-        result = []
-        for sitename, site, connection in self.connections:
-            if self.only_sites != None and sitename not in self.only_sites:
-                stillalive.append( (sitename, site, connection) ) # state unknown, assume still alive
-                continue
+        # Then read from all sockets that have data, so that a slow site
+        # does not delay reading the answers of the other ones
+        while pending:
+            if deadline:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+            else:
+                timeout = None
 
             try:
-                r = connection.recv_response(query, add_headers + limit_header)
-                stillalive.append( (sitename, site, connection) )
-                if self.prepend_site:
-                    r = [ [sitename] + l for l in r ]
-                result += r
-            except Exception, e:
-                self.deadsites[sitename] = {
-                    "exception" : e,
-                    "site" : site,
-                }
+                readable = select.select(pending.keys(), [], [], timeout)[0]
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+
+            for sock in readable:
+                sitename, site, connection, retried = pending[sock]
+                try:
+                    rows = connection.read_response_part()
+                    if cache_rows != None:
+                        cache_rows.setdefault(sitename, []).extend(rows)
+                    if connection.response_complete():
+                        del pending[sock]
+                        self.account_site_time(sitename, time.time() - start_time)
+                        if cache_rows != None:
+                            self.cache.put(sitename, query + add_headers, connection.auth_header,
+                                           cache_rows.get(sitename, []))
+                    if rows:
+                        yield sitename, rows
+
+                # The site might have closed a persistent connection due to
+                # a timeout during keepalive. If nothing has been received
+                # yet, reconnect and send the query again, but only once.
+                except (MKLivestatusSocketClosed, IOError), e:
+                    del pending[sock]
+                    if retried or connection.response_size != None:
+                        self.deadsites[sitename] = {
+                            "exception" : MKLivestatusSocketError(str(e)),
+                            "site" : site,
+                        }
+                        continue
+                    try:
+                        connection.disconnect()
+                        connection.connect()
+                        connection.send_query(query, add_headers)
+                        connection.start_response()
+                        pending[connection.socket] = (sitename, site, connection, True)
+                    except Exception, e:
+                        self.deadsites[sitename] = {
+                            "exception" : e,
+                            "site" : site,
+                        }
+
+                except Exception, e:
+                    del pending[sock]
+                    self.deadsites[sitename] = {
+                        "exception" : e,
+                        "site" : site,
+                    }
 
+        # Sites that did not answer in time. The rest of their answer
+        # would be read by the next query, so their connection is dropped.
+        for sitename, site, connection, retried in pending.values():
+            connection.socket.close()
+            connection.disconnect()
+            self.account_site_time(sitename, time.time() - start_time, True)
+            self.deadsites[sitename] = {
+                "exception" : MKLivestatusSocketError("Timeout while waiting for the answer (%.1f sec)" %
+                                                      self.query_timeout),
+                "site"      : site,
+                "timeout"   : True,
+            }
+
+    def account_site_time(self, sitename, duration, timeout = False):
+        stats = self.site_stats.setdefault(sitename, {
+            "queries"  : 0,
+            "total"    : 0.0,
+            "last"     : 0.0,
+            "max"      : 0.0,
+            "timeouts" : 0,
+        })
+        stats["queries"] += 1
+        stats["total"] += duration
+        stats["last"] = duration
+        stats["max"] = max(stats["max"], duration)
+        if timeout:
+            stats["timeouts"] += 1
+
+    # Like query_parallel(), but returns an iterator over the rows. The
+    # rows of all sites are returned as soon as they have been received,
+    # so the answers of the sites are mixed and a site might fail after
+    # some of its rows have been returned. The iterator must be exhausted
+    # before the connection is used again.
+    def query_iter(self, query, add_headers = ""):
+        for sitename, rows in self.receive_answers(query, add_headers):
+            for line in rows:
+                if self.prepend_site:
+                    yield [sitename] + line
+                else:
+                    yield line
 
-        self.connections = stillalive
-        return result
+        self.connections = [ c for c in self.connections if c[0] not in self.deadsites ]
 
     def command(self, command, sitename = "local"):
         if sitename in self.deadsites:
@@ -34,12 +34,12 @@ class MKAutomationError(Exception):
 def do_automation(cmd, args):
     try:
         if cmd == "get-configuration":
-            read_config_files(with_autochecks=False, with_conf_d=False)
+            read_config_files(with_conf_d=False)
             result = automation_get_configuration()
         elif cmd == "get-check-information":
             result = automation_get_check_information()
         elif cmd == "delete-host":
-            read_config_files(with_autochecks=False)
+            read_config_files()
             result = automation_delete_host(args)
         else:
             read_config_files()
@@ -80,10 +80,12 @@ def do_automation(cmd, args):
         sys.stdout.write(pprint.pformat(result)+"\n")
     else:
         sys.stdout.write("%r\n" % (result,))
+    write_check_parameters_cache()
+    write_dns_cache()
     output_profile()
     sys.exit(0)
 
-# Does inventory for *one* host. Possible values for how:
+# Does inventory for one or several hosts. Possible values for how:
 # "new" - find only new services (like -I)
 # "remove" - remove exceeding services
 # "fixall" - find new, remove exceeding
@@ -93,8 +95,34 @@ def automation_inventory(args):
         raise MKAutomationError("Need two arguments: [new|remove|fixall|refresh] HOSTNAME")
 
     how = args[0]
-    hostname = args[1]
+    hostnames = args[1:]
+    if len(hostnames) == 1:
+        return automation_inventory_host(how, hostnames[0])
+
+    # Several hosts are inventorized in parallel. The result is a
+    # dictionary from the host name to the counts of the host - or to
+    # the error message if the inventory of that host failed. The
+    # autochecks of the hosts are removed here and not in the
+    # parallel processes, since they modify the same files.
+    count_removed = dict([ (hostname, 0) for hostname in hostnames ])
+    if how == "refresh":
+        for hostname in hostnames:
+            count_removed[hostname] = remove_autochecks_of(hostname)
+        reread_autochecks()
+        how = "new"
+
+    result = {}
+    for hostname, (success, counts) in \
+        run_parallel(hostnames, lambda hostname: automation_inventory_host(how, hostname)).items():
+        if success:
+            added, removed, kept, total = counts
+            result[hostname] = (added, removed + count_removed[hostname], kept, total)
+        else:
+            result[hostname] = counts or "Inventory failed"
+    return result
+
 
+def automation_inventory_host(how, hostname):
     count_added = 0
     count_removed = 0
     count_kept = 0
@@ -224,7 +252,7 @@ def automation_try_inventory_node(hostname):
        found[(ct, item)] = ( state_type, paramstring )
 
     # Check if already in autochecks (but not found anymore)
-    for hn, ct, item, params in autochecks:
+    for hn, ct, item, params in read_autochecks_of(hostname):
         if hn == hostname and (ct, item) not in found:
             found[(ct, item)] = ( 'vanished', repr(params) ) # This is not the real paramstring!
 
@@ -344,7 +372,7 @@ def automation_set_autochecks(args):
     hostname = args[0]
     new_items = eval(sys.stdin.read())
 
-    do_cleanup_autochecks()
+    convert_legacy_autochecks()
     existing = automation_parse_autochecks_file(hostname)
 
     # write new autochecks file, but take paramstrings from existing ones
@@ -364,18 +392,14 @@ def automation_set_autochecks(args):
 
 def automation_get_autochecks(args):
     hostname = args[0]
-    do_cleanup_autochecks()
+    convert_legacy_autochecks()
     return automation_parse_autochecks_file(hostname)
 
 def automation_write_autochecks_file(hostname, table):
-    if not os.path.exists(autochecksdir):
-        os.makedirs(autochecksdir)
-    path = "%s/%s.mk" % (autochecksdir, hostname)
-    f = file(path, "w")
-    f.write("# Autochecks for host %s, created by Check_MK automation\n[\n" % hostname)
-    for ct, item, paramstring in table:
-        f.write("  (%r, %r, %r, %s),\n" % (hostname, ct, item, paramstring))
-    f.write("]\n")
+    lines = [ "  (%r, %r, %r, %s),\n" % (hostname, ct, item, paramstring)
+              for ct, item, paramstring in table ]
+    write_autochecks_lines_of(hostname, lines,
+        "# Autochecks for host %s, created by Check_MK automation\n[\n" % hostname)
 
 def automation_parse_autochecks_file(hostname):
     def split_python_tuple(line):
@@ -406,7 +430,7 @@ def automation_parse_autochecks_file(hostname):
                 return value.strip(), rest
         return line.strip(), None
 
-    path = "%s/%s.mk" % (autochecksdir, hostname)
+    path = autochecks_file(hostname)
     if not os.path.exists(path):
         return []
     lineno = 0
@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2012             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# ails.  You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+
+# The check helper is a long running process that keeps all checks,
+# the configuration and the check tables of the hosts in memory. It
+# listens on a UNIX socket for host checks. A request is one line
+# with the host name and optionally the IP address of the host:
+#
+# myhost 10.1.1.4
+#
+# The answer is the exit status of the check, a space and the
+# status line of the Check_MK service - exactly what check_mk
+# would print when called with the host name. Then the connection
+# is closed. The requests are processed by a pool of preforked
+# worker processes. Precompiled host checks automatically send their
+# requests to the check helper if use_check_helper is set to True.
+
+g_check_helper_workers   = {}    # pid -> start time
+g_check_helper_terminate = False
+g_check_helper_reload    = False
+
+def check_helper_pidfile():
+    return check_helper_socket + ".pid"
+
+def do_check_helper():
+    global g_check_helper_terminate, g_check_helper_reload
+
+    socket_dir = os.path.dirname(check_helper_socket)
+    if socket_dir and not os.path.exists(socket_dir):
+        os.makedirs(socket_dir)
+    if os.path.exists(check_helper_socket):
+        os.remove(check_helper_socket)
+
+    listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listen_socket.bind(check_helper_socket)
+    listen_socket.listen(128)
+    file(check_helper_pidfile(), "w").write("%d\n" % os.getpid())
+
+    def handle_signal(signum, stackframe):
+        global g_check_helper_terminate, g_check_helper_reload
+        if signum == signal.SIGHUP:
+            g_check_helper_reload = True
+        else:
+            g_check_helper_terminate = True
+
+    for signum in [ signal.SIGTERM, signal.SIGINT, signal.SIGHUP ]:
+        signal.signal(signum, handle_signal)
+
+    verbose("Check helper listening on %s with %d processes.\n" %
+            (check_helper_socket, check_helper_processes))
+
+    while not g_check_helper_terminate and not g_check_helper_reload:
+        while len(g_check_helper_workers) < check_helper_processes:
+            start_check_helper_worker(listen_socket)
+
+        try:
+            pid, exit_status = os.wait()
+        except OSError:
+            continue # interrupted by signal
+
+        if pid in g_check_helper_workers:
+            started = g_check_helper_workers[pid]
+            del g_check_helper_workers[pid]
+            sys.stderr.write("Check helper process %d died with exit code %d.\n" %
+                             (pid, exit_status >> 8))
+            if time.time() - started < 1:
+                time.sleep(1) # Avoid forking like mad if something is broken
+
+    # Shutdown all workers and wait for them to terminate
+    for pid in g_check_helper_workers.keys():
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    for pid in g_check_helper_workers.keys():
+        try:
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+    listen_socket.close()
+    os.remove(check_helper_socket)
+    os.remove(check_helper_pidfile())
+
+    # Reloading is done by executing ourselves again. That way
+    # changed checks and configuration files are read in.
+    if g_check_helper_reload:
+        verbose("Reloading check helper.\n")
+        os.execv(sys.executable, [ sys.executable, sys.argv[0],
+                 "--defaults", defaults_path ] + sys.argv[1:])
+
+
+def start_check_helper_worker(listen_socket):
+    pid = os.fork()
+    if pid:
+        g_check_helper_workers[pid] = time.time()
+        return
+
+    try:
+        for signum in [ signal.SIGTERM, signal.SIGINT ]:
+            signal.signal(signum, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        check_helper_worker(listen_socket)
+    except Exception, e:
+        sys.stderr.write("Exception in check helper process: %s\n" % e)
+    os._exit(1)
+
+
+def check_helper_worker(listen_socket):
+    global g_counters_cache, opt_use_cachefile
+    g_counters_cache = {}
+    initial_use_cachefile = opt_use_cachefile
+
+    while True:
+        try:
+            connection, address = listen_socket.accept()
+        except socket.error:
+            continue # interrupted system call
+
+        try:
+            request = ""
+            while not request.endswith("\n"):
+                chunk = connection.recv(4096)
+                if not chunk:
+                    break
+                request += chunk
+
+            opt_use_cachefile = initial_use_cachefile
+            status, output = check_helper_check_host(request)
+            connection.sendall("%d %s" % (status, output))
+        except socket.error:
+            pass
+        connection.close()
+
+
+def check_helper_check_host(request):
+    parts = request.split()
+    if len(parts) not in [ 1, 2 ]:
+        return 3, "UNKNOWN - Invalid request to check helper: %r\n" % request
+
+    hostname = parts[0]
+    if hostname not in all_hosts_untagged and not is_cluster(hostname):
+        return 3, "UNKNOWN - Host %s is unknown to the check helper. " \
+                  "Please reload it.\n" % hostname
+
+    reset_host_caches()
+    try:
+        if len(parts) == 2:
+            ipaddress = parts[1]
+        elif is_cluster(hostname):
+            ipaddress = None
+        else:
+            ipaddress = lookup_ipaddress(hostname)
+        return do_check_host(hostname, ipaddress)
+
+    except SystemExit, e:
+        return 3, "UNKNOWN - Check tried to exit with code %s\n" % e
+    except Exception, e:
+        if opt_debug:
+            import traceback
+            traceback.print_exc()
+        return 3, "UNKNOWN - %s\n" % e
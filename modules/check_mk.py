@@ -36,6 +36,8 @@ check_mk_version  = '(inofficial)'
 # want to output some verbose messages.
 g_profile      = None
 g_profile_path = 'profile.out'
+g_startup_time = time.time()
+g_config_read_time = None
 
 if __name__ == "__main__":
     opt_debug        = '--debug' in sys.argv[1:]
@@ -222,12 +224,22 @@ perfdata_format                    = "pnp" # also possible: "standard"
 debug_log                          = None
 monitoring_host                    = None # deprecated
 max_num_processes                  = 50
+max_num_connections                = 200 # parallel TCP connections to agents, e.g. during -I
+counters_max_age                   = 7 * 86400 # remove counters not changed for one week
+dns_cache_max_age                  = 86400 # keep resolved IP addresses one day (0: no persistent cache)
+dns_cache_negative_max_age         = 300   # keep failed DNS lookups five minutes
+
+# Check helper (persistent process executing the host checks)
+use_check_helper                   = False
+check_helper_socket                = var_dir + "/check_helper.socket"
+check_helper_processes             = 10
 
 # SNMP communities and encoding
 snmp_default_community             = 'public'
 snmp_communities                   = []
 snmp_timing                        = []
 snmp_character_encodings           = []
+use_inline_snmp                    = False # fetch SNMP data without snmpwalk
 
 # Inventory and inventory checks
 inventory_check_interval           = None # Nagios intervals (4h = 240)
@@ -376,7 +388,17 @@ def no_inventory_possible(checkname, info):
 # values. The user can override those variables in his configuration.
 # Do not read in the checks if check_mk is called as module
 
-if __name__ == "__main__":
+# Compiling the check files is the most expensive part of reading
+# them. The compiled code of all checks is kept in one cache file,
+# together with the modification time and the size of each check
+# file. Only check files that have changed are compiled again.
+checks_cache_file = var_dir + "/checks.cache"
+g_checks_load_stats = None # number of files, number of files from cache, time
+
+def load_checks():
+    global g_checks_load_stats
+    start_time = time.time()
+
     filelist = glob.glob(checks_dir + "/*")
     filelist.sort()
 
@@ -391,16 +413,67 @@ if __name__ == "__main__":
     filelist = [ f for f in filelist if f.endswith(".include") ] + \
                [ f for f in filelist if not f.endswith(".include") ]
 
+    cache = read_checks_cache()
+    new_cache = {}
+    num_cached = 0
     for f in filelist:
         if not f.endswith("~"): # ignore emacs-like backup files
             try:
-                execfile(f)
+                st = os.stat(f)
+                cached = cache.get(f)
+                if cached and cached[0] == st.st_mtime and cached[1] == st.st_size:
+                    code = cached[2]
+                    num_cached += 1
+                else:
+                    code = compile(file(f).read(), f, "exec")
+                new_cache[f] = (st.st_mtime, st.st_size, code)
+                exec code in globals()
             except Exception, e:
                 sys.stderr.write("Error in plugin file %s: %s\n" % (f, e))
                 if opt_debug:
                     raise
                 sys.exit(5)
 
+    if num_cached != len(new_cache) or len(cache) != len(new_cache):
+        write_checks_cache(new_cache)
+
+    g_checks_load_stats = len(new_cache), num_cached, time.time() - start_time
+
+def read_checks_cache():
+    try:
+        version, cache = marshal.load(file(checks_cache_file))
+        if version == sys.version: # code objects differ between versions
+            return cache
+    except:
+        pass
+    return {}
+
+def write_checks_cache(cache):
+    if i_am_root():
+        return # never create files as root
+    try:
+        tmp_path = "%s.new%d" % (checks_cache_file, os.getpid())
+        f = file(tmp_path, "w")
+        marshal.dump((sys.version, cache), f)
+        f.close()
+        os.rename(tmp_path, checks_cache_file)
+    except Exception, e:
+        if opt_debug:
+            sys.stderr.write("Cannot write %s: %s\n" % (checks_cache_file, e))
+
+# Some operation modes do not need any check
+def checks_needed():
+    for arg in sys.argv[1:]:
+        if arg in [ '-V', '--version', '-h', '--help', '-P', '--package' ]:
+            return False
+        elif arg not in [ '-v', '--verbose', '--debug', '--profile' ]:
+            return True
+    return True
+
+if __name__ == "__main__":
+    if checks_needed():
+        load_checks()
+
     # Now convert check_info to new format.
     convert_check_info()
 
@@ -511,10 +584,14 @@ def host_is_aggregated(hostname):
     if in_binary_hostlist(hostname, non_aggregated_hosts):
         return False
 
-    # convert into host_conf_list suitable for host_extra_conf()
-    host_conf_list = [ entry[:-1] for entry in service_aggregations ]
-    is_aggr = len(host_extra_conf(hostname, host_conf_list)) > 0
-    return is_aggr
+    for value in matching_rules(hostname, service_aggregations, parse_aggregation_host_rule):
+        return True
+    return False
+
+# Reads a rule of service_aggregations like a host_extra_conf() rule,
+# ignoring the service patterns at the end
+def parse_aggregation_host_rule(entry):
+    return parse_host_extra_conf_rule(entry[:-1])
 
 # Determines the aggretated service name for a given
 # host and service description. Returns "" if the service
@@ -684,6 +761,9 @@ def get_single_oid(hostname, ipaddress, oid):
         g_single_oid_hostname = hostname
         g_single_oid_cache = {}
 
+    if not oid.startswith("."):
+        oid = "." + oid
+
     if oid in g_single_oid_cache:
         return g_single_oid_cache[oid]
 
@@ -701,16 +781,32 @@ def get_single_oid(hostname, ipaddress, oid):
         oid_prefix = oid
         commandtype = "get"
 
+    if use_inline_snmp_for(hostname):
+        try:
+            value = inline_snmp_get(hostname, ipaddress, oid_prefix, commandtype == "getnext")
+        except MKSNMPError:
+            value = None
+        g_single_oid_cache[oid] = value
+        return value
+
     portspec = snmp_port_spec(hostname)
     command = snmp_base_command(commandtype, hostname) + \
          " -On -OQ -Oe -Ot %s%s %s 2>/dev/null" % (ipaddress, portspec, oid_prefix)
+    if opt_debug:
+        sys.stdout.write("Running '%s'\n" % command)
     try:
-        if opt_debug:
-            sys.stdout.write("Running '%s'\n" % command)
+        line = os.popen(command, "r").readline()
+    except:
+        line = ""
+
+    value = parse_single_oid_answer(line, commandtype, oid_prefix)
+    g_single_oid_cache[oid] = value
+    return value
 
-        snmp_process = os.popen(command, "r")
-        line = snmp_process.readline().strip()
-        item, value = line.split("=")
+# Parse one line of output of snmpget/snmpgetnext
+def parse_single_oid_answer(line, commandtype, oid_prefix):
+    try:
+        item, value = line.strip().split("=")
         value = value.strip()
         if opt_debug:
             sys.stdout.write("SNMP answer: ==> [%s]\n" % value)
@@ -732,10 +828,92 @@ def get_single_oid(hostname, ipaddress, oid):
         # value = value_num
     except:
         value = None
-
-    g_single_oid_cache[oid] = value
     return value
 
+# Put the values of several OIDs into the cache of get_single_oid()
+# with one SNMP request (or one call of snmpget) per 16 OIDs. OIDs ending
+# with ".*" are skipped, they need a getnext of their own. OIDs not
+# found in the answer are left to get_single_oid().
+def prefetch_single_oids(hostname, ipaddress, oids):
+    global g_single_oid_hostname
+    global g_single_oid_cache
+
+    if opt_use_snmp_walk or is_usewalk_host(hostname):
+        return
+
+    if g_single_oid_hostname != hostname:
+        g_single_oid_hostname = hostname
+        g_single_oid_cache = {}
+
+    todo = []
+    for oid in oids:
+        if not oid.startswith("."):
+            oid = "." + oid
+        if not oid.endswith(".*") and oid not in g_single_oid_cache and oid not in todo:
+            todo.append(oid)
+
+    while todo:
+        chunk = todo[:16]
+        todo = todo[16:]
+
+        if use_inline_snmp_for(hostname):
+            try:
+                g_single_oid_cache.update(inline_snmp_get_multiple(hostname, ipaddress, chunk))
+            except MKSNMPError:
+                pass
+            continue
+
+        command = snmp_base_command("get", hostname) + \
+             " -On -OQ -Oe -Ot %s%s %s 2>/dev/null" % (
+                 ipaddress, snmp_port_spec(hostname), " ".join(chunk))
+        if opt_debug:
+            sys.stdout.write("Running '%s'\n" % command)
+        try:
+            lines = os.popen(command, "r").readlines()
+        except:
+            lines = []
+
+        # Values might span several lines. Only the first one
+        # is used - just as get_single_oid() does.
+        for line in lines:
+            oid = line.split("=")[0].strip()
+            if oid in chunk and oid not in g_single_oid_cache:
+                g_single_oid_cache[oid] = parse_single_oid_answer(line, "get", oid)
+
+# Scan functions call get_single_oid() for one OID after the other.
+# In order to batch these requests, the scan functions are first run
+# with a dummy function that only returns cached values and notes all
+# other OIDs. These are then fetched at once and the scan functions
+# run again, until no new OIDs are needed. Then the real scan is done.
+class MKOIDMissing(Exception):
+    pass
+
+def prefetch_scan_oids(hostname, ipaddress, scan_functions):
+    def get_cached_oid(oid):
+        if not oid.startswith("."):
+            oid = "." + oid
+        if oid in g_single_oid_cache:
+            return g_single_oid_cache[oid]
+        missing.add(oid)
+        raise MKOIDMissing()
+
+    while True:
+        missing = set([])
+        for check_type, scan_function in scan_functions:
+            try:
+                scan_function(get_cached_oid)
+            except:
+                pass
+
+        # Only OIDs that have not been tried, yet
+        missing = [ oid for oid in missing if not oid.endswith(".*") ]
+        if not missing:
+            break
+        prefetch_single_oids(hostname, ipaddress, missing)
+        for oid in missing:
+            if oid not in g_single_oid_cache:
+                return # prefetch failed, leave the rest to get_single_oid()
+
 def snmp_scan(hostname, ipaddress):
     # Make hostname globally available for scan functions.
     # This is rarely used, but e.g. the scan for if/if64 needs
@@ -745,13 +923,15 @@ def snmp_scan(hostname, ipaddress):
 
     if opt_verbose:
         sys.stdout.write("Scanning host %s(%s) for SNMP checks..." % (hostname, ipaddress))
+    # sysDescr and sysObjectID are needed by most of the scan functions
+    prefetch_single_oids(hostname, ipaddress, [ ".1.3.6.1.2.1.1.1.0", ".1.3.6.1.2.1.1.2.0" ])
     sys_descr = get_single_oid(hostname, ipaddress, ".1.3.6.1.2.1.1.1.0")
     if sys_descr == None:
         if opt_debug:
             sys.stderr.write("no SNMP answer\n")
         return []
 
-    found = []
+    scan_functions = []
     for check_type, check in check_info.items():
         if check_type in ignored_checktypes:
             continue
@@ -762,8 +942,13 @@ def snmp_scan(hostname, ipaddress):
         # subchecks sharing the same SNMP info of course should have
         # an identical scan function. But some checks do not do this
         # correctly
-        scan_function = snmp_scan_functions.get(check_type,
-                snmp_scan_functions.get(basename))
+        scan_functions.append((check_type, snmp_scan_functions.get(check_type,
+                snmp_scan_functions.get(basename))))
+
+    prefetch_scan_oids(hostname, ipaddress, [ (ct, sf) for (ct, sf) in scan_functions if sf ])
+
+    found = []
+    for check_type, scan_function in scan_functions:
         if scan_function:
             try:
                 if scan_function(lambda oid: get_single_oid(hostname, ipaddress, oid)):
@@ -920,6 +1105,9 @@ def get_check_table(hostname):
 
     # Now process all entries that are specific to the host
     # in search (single host) or that might match the host.
+    for entry in read_autochecks_of(hostname):
+        handle_entry(entry)
+
     for entry in g_singlehost_checks.get(hostname, []):
         handle_entry(entry)
 
@@ -952,29 +1140,38 @@ def get_sorted_check_table(hostname):
             return 1
     unsorted.sort(cmp)
 
+    # Topological sort (Kahn). A check is ready when none of the
+    # services it depends upon is left. The checks are output level
+    # by level, each level in the order of the service descriptions.
+    by_descr = {}
+    for nr, check in enumerate(unsorted):
+        by_descr.setdefault(check[3], []).append(nr)
+
+    num_deps = [ 0 ] * len(unsorted) # number of checks not yet output
+    dependants = [ [] for check in unsorted ]
+    for nr, check in enumerate(unsorted):
+        for dep in set(check[4]):
+            for dep_nr in by_descr.get(dep, []):
+                num_deps[nr] += 1
+                dependants[dep_nr].append(nr)
 
     sorted = []
-    while len(unsorted) > 0:
-        unsorted_descrs = set([ entry[3] for entry in unsorted ])
-        left = []
-        at_least_one_hit = False
-        for check in unsorted:
-            deps_fullfilled = True
-            for dep in check[4]: # deps
-                if dep in unsorted_descrs:
-                    deps_fullfilled = False
-                    break
-            if deps_fullfilled:
-                sorted.append(check)
-                at_least_one_hit = True
-            else:
-                left.append(check)
-        if len(left) == 0:
-            break
-        if not at_least_one_hit:
-            raise MKGeneralException("Cyclic service dependency of host %s. Problematic are: %s" %
-                                     (hostname, ",".join(unsorted_descrs)))
-        unsorted = left
+    ready = [ nr for nr in range(len(unsorted)) if num_deps[nr] == 0 ]
+    while ready:
+        next_ready = []
+        for nr in ready:
+            sorted.append(unsorted[nr])
+            for dep_nr in dependants[nr]:
+                num_deps[dep_nr] -= 1
+                if num_deps[dep_nr] == 0:
+                    next_ready.append(dep_nr)
+        next_ready.sort()
+        ready = next_ready
+
+    if len(sorted) < len(unsorted):
+        unsorted_descrs = set([ check[3] for nr, check in enumerate(unsorted) if num_deps[nr] > 0 ])
+        raise MKGeneralException("Cyclic service dependency of host %s. Problematic are: %s" %
+                                 (hostname, ",".join(unsorted_descrs)))
     return sorted
 
 
@@ -1009,19 +1206,148 @@ def lookup_ipaddress(hostname):
     if in_binary_hostlist(hostname, dyndns_hosts):
         return hostname
 
+    # Address has been resolved by an earlier call of Check_MK?
+    if hostname not in g_dns_cache:
+        entry = cached_dns_lookup(hostname)
+        if entry:
+            g_dns_cache[hostname] = entry[0]
+
     # Address has already been resolved in prior call to this function?
+    # Failed lookups are remembered as None.
     if hostname in g_dns_cache:
-        return g_dns_cache[hostname]
+        ipa = g_dns_cache[hostname]
+        if ipa == None:
+            raise MKGeneralException("Cannot resolve host name %s (failed lookup is cached)" % hostname)
+        return ipa
 
     # No do the actual DNS lookup
     try:
         ipa = socket.gethostbyname(hostname)
     except:
         g_dns_cache[hostname] = None
+        store_dns_lookup(hostname, None)
         raise
     g_dns_cache[hostname] = ipa
+    store_dns_lookup(hostname, ipa)
     return ipa
 
+# The results of DNS lookups are kept in a file, so that further
+# calls of Check_MK need not resolve the host names again. Successful
+# lookups are valid for dns_cache_max_age seconds, failed lookups for
+# dns_cache_negative_max_age seconds.
+dns_cache_file = var_dir + "/ipaddresses.cache"
+g_dns_cache_entries = None # hostname -> (IP address or None, time of lookup)
+g_dns_cache_changed = False
+
+def read_dns_cache():
+    global g_dns_cache_entries
+    try:
+        g_dns_cache_entries = marshal.load(file(dns_cache_file))
+    except:
+        g_dns_cache_entries = {}
+
+def write_dns_cache():
+    if not g_dns_cache_changed or i_am_root():
+        return # never create files as root
+    try:
+        tmp_path = "%s.new%d" % (dns_cache_file, os.getpid())
+        file(tmp_path, "w").write(marshal.dumps(g_dns_cache_entries))
+        os.rename(tmp_path, dns_cache_file)
+    except Exception, e:
+        if opt_debug:
+            sys.stderr.write("Cannot write %s: %s\n" % (dns_cache_file, e))
+
+# Returns (ipaddress, time of lookup) or None, if the host name
+# has not been resolved or the entry is outdated.
+def cached_dns_lookup(hostname):
+    if dns_cache_max_age <= 0:
+        return None
+    if g_dns_cache_entries == None:
+        read_dns_cache()
+    entry = g_dns_cache_entries.get(hostname)
+    if entry:
+        if entry[0] == None:
+            max_age = dns_cache_negative_max_age
+        else:
+            max_age = dns_cache_max_age
+        if time.time() - entry[1] < max_age:
+            return entry
+    return None
+
+def store_dns_lookup(hostname, ipaddress):
+    global g_dns_cache_changed
+    if dns_cache_max_age <= 0:
+        return
+    if g_dns_cache_entries == None:
+        read_dns_cache()
+    g_dns_cache_entries[hostname] = (ipaddress, time.time())
+    g_dns_cache_changed = True
+
+# Hosts whose IP address is looked up via DNS by lookup_ipaddress()
+def needs_dns_lookup(hostname):
+    return not fake_dns and not simulation_mode and not opt_use_snmp_walk \
+        and not (is_usewalk_host(hostname) and is_snmp_host(hostname)) \
+        and not ipaddresses.get(hostname) \
+        and not in_binary_hostlist(hostname, dyndns_hosts)
+
+# Resolve the names of all hosts that are not in the DNS cache (or
+# all, if refresh is True) in parallel processes and update the cache
+# file. Then the lookups of the following operation are done without
+# waiting for the DNS. Returns the number of hosts looked up and the
+# number of failed lookups.
+def update_dns_cache(hostnames, refresh = False):
+    global g_dns_cache_changed
+    if dns_cache_max_age <= 0:
+        return 0, 0
+    todo = [ h for h in hostnames if needs_dns_lookup(h) ]
+    if not refresh:
+        todo = [ h for h in todo if h not in g_dns_cache and not cached_dns_lookup(h) ]
+    if not todo:
+        return 0, 0
+    elif g_dns_cache_entries == None:
+        read_dns_cache()
+
+    # DNS lookups mostly wait for the network, so use all processes
+    num_procs = min(max(1, max_num_processes), len(todo))
+    if num_procs > 1 and not opt_debug:
+        parts = [ tuple(todo[i::num_procs]) for i in range(num_procs) ]
+        results = {}
+        for part, (success, result) in run_parallel(parts, resolve_hostnames).items():
+            if success:
+                results.update(result)
+    else:
+        results = resolve_hostnames(todo)
+
+    # Hosts of crashed processes are simply not cached
+    now = time.time()
+    failed = 0
+    for hostname, ipa in results.items():
+        if ipa == None:
+            failed += 1
+        g_dns_cache[hostname] = ipa
+        g_dns_cache_entries[hostname] = (ipa, now)
+    g_dns_cache_changed = True
+    write_dns_cache()
+    return len(results), failed
+
+def resolve_hostnames(hostnames):
+    results = {}
+    for hostname in hostnames:
+        try:
+            results[hostname] = socket.gethostbyname(hostname)
+        except:
+            results[hostname] = None
+    return results
+
+# Implementation of option --update-dns-cache
+def do_update_dns_cache():
+    if dns_cache_max_age <= 0:
+        raise MKGeneralException("The DNS cache is disabled (dns_cache_max_age is 0).")
+    sys.stdout.write("Updating DNS cache...")
+    sys.stdout.flush()
+    num_hosts, num_failed = update_dns_cache(all_hosts_untagged + all_active_clusters(), refresh = True)
+    sys.stdout.write("%d host names looked up, %d failed.\n" % (num_hosts, num_failed))
+
 def agent_port_of(hostname):
     ports = host_extra_conf(hostname, agent_ports)
     if len(ports) == 0:
@@ -1257,100 +1583,88 @@ def check_icmp_arguments(hostname):
     return " ".join(args)
 
 
-# Return a list of services this services depends upon
+# Return a list of services this services depends upon. The result
+# of the regex matching is cached per host and service.
+g_service_deps_cache = {}
 def service_deps(hostname, servicedesc):
-    deps = []
-    for entry in service_dependencies:
-        entry, rule_options = get_rule_options(entry)
-        if rule_options.get("disabled"):
-            continue
-
-        if len(entry) == 3:
-            depname, hostlist, patternlist = entry
-            tags = []
-        elif len(entry) == 4:
-            depname, tags, hostlist, patternlist = entry
-        else:
-            raise MKGeneralException("Invalid entry '%r' in service dependencies: must have 3 or 4 entries" % entry)
+    cache_key = (hostname, servicedesc)
+    if cache_key in g_service_deps_cache:
+        return g_service_deps_cache[cache_key][:] # the caller may modify the list
 
-        if hosttags_match_taglist(tags_of_host(hostname), tags) and \
-           in_extraconf_hostlist(hostlist, hostname):
-            for pattern in patternlist:
-                reg = compiled_regexes.get(pattern)
-                if not reg:
-                    reg = re.compile(pattern)
-                    compiled_regexes[pattern] = reg
-                matchobject = reg.search(servicedesc)
-                if matchobject:
-                    try:
-                        item = matchobject.groups()[-1]
-                        deps.append(depname % item)
-                    except:
-                        deps.append(depname)
+    deps = []
+    for depname, patternlist in matching_rules(hostname, service_dependencies, parse_service_deps_rule):
+        for pattern in patternlist:
+            reg = compiled_regexes.get(pattern)
+            if not reg:
+                reg = re.compile(pattern)
+                compiled_regexes[pattern] = reg
+            matchobject = reg.search(servicedesc)
+            if matchobject:
+                try:
+                    item = matchobject.groups()[-1]
+                    deps.append(depname % item)
+                except:
+                    deps.append(depname)
+    g_service_deps_cache[cache_key] = deps[:]
     return deps
 
+def parse_service_deps_rule(entry):
+    if len(entry) == 3:
+        depname, hostlist, patternlist = entry
+        tags = []
+    elif len(entry) == 4:
+        depname, tags, hostlist, patternlist = entry
+    else:
+        raise MKGeneralException("Invalid entry '%r' in service dependencies: must have 3 or 4 entries" % (entry,))
+    return (depname, patternlist), tags, hostlist
 
-def host_extra_conf(hostname, conf):
-    items = []
-    if len(conf) == 1 and conf[0] == "":
-        sys.stderr.write('WARNING: deprecated entry [ "" ] in host configuration list\n')
-
-    for entry in conf:
-        entry, rule_options = get_rule_options(entry)
-        if rule_options.get("disabled"):
-            continue
-
-        if len(entry) == 2:
-            item, hostlist = entry
-            tags = []
-        elif len(entry) == 3:
-            item, tags, hostlist = entry
-        else:
-            raise MKGeneralException("Invalid entry '%r' in host configuration list: must have 2 or 3 entries" % (entry,))
 
-        if hosttags_match_taglist(tags_of_host(hostname), tags) and \
-           in_extraconf_hostlist(hostlist, hostname):
-            items.append(item)
-    return items
+def host_extra_conf(hostname, conf):
+    return list(matching_rules(hostname, conf, parse_host_extra_conf_rule))
+
+def parse_host_extra_conf_rule(entry):
+    if len(entry) == 2:
+        item, hostlist = entry
+        tags = []
+    elif len(entry) == 3:
+        item, tags, hostlist = entry
+    else:
+        raise MKGeneralException("Invalid entry '%r' in host configuration list: must have 2 or 3 entries" % (entry,))
+    return item, tags, hostlist
 
 def in_binary_hostlist(hostname, conf):
     # if we have just a list of strings just take it as list of (may be tagged) hostnames
     if len(conf) > 0 and type(conf[0]) == str:
         return hostname in strip_tags(conf)
 
-    for entry in conf:
-        entry, rule_options = get_rule_options(entry)
-        if rule_options.get("disabled"):
-            continue
+    for negate in matching_rules(hostname, conf, parse_binary_hostlist_rule, True):
+        return not negate
+    return False
 
-        try:
-            # Negation via 'NEGATE'
-            if entry[0] == NEGATE:
-                entry = entry[1:]
-                negate = True
-            else:
-                negate = False
-            # entry should be one-tuple or two-tuple. Tuple's elements are
-            # lists of strings. User might forget comma in one tuple. Then the
-            # entry is the list itself.
-            if type(entry) == list:
-                hostlist = entry
+def parse_binary_hostlist_rule(entry):
+    try:
+        # Negation via 'NEGATE'
+        if entry[0] == NEGATE:
+            entry = entry[1:]
+            negate = True
+        else:
+            negate = False
+        # entry should be one-tuple or two-tuple. Tuple's elements are
+        # lists of strings. User might forget comma in one tuple. Then the
+        # entry is the list itself.
+        if type(entry) == list:
+            hostlist = entry
+            tags = []
+        else:
+            if len(entry) == 1: # 1-Tuple with list of hosts
+                hostlist = entry[0]
                 tags = []
             else:
-                if len(entry) == 1: # 1-Tuple with list of hosts
-                    hostlist = entry[0]
-                    tags = []
-                else:
-                    tags, hostlist = entry
-
-            if hosttags_match_taglist(tags_of_host(hostname), tags) and \
-                   in_extraconf_hostlist(hostlist, hostname):
-                return not negate
-
-        except:
-            MKGeneralException("Invalid entry '%r' in host configuration list: must be tupel with 1 or 2 entries" % (entry,))
+                tags, hostlist = entry
+        return negate, tags, hostlist
 
-    return False
+    except:
+        return None # invalid entries are silently ignored
 
 # Pick out the last element of an entry if it is a dictionary.
 # This is a new feature (1.2.0p3) that allows to add options
@@ -1367,24 +1681,176 @@ def get_rule_options(entry):
 # conf is either service_groups or service_contactgroups
 def service_extra_conf(hostname, service, conf):
     entries = []
-    for entry in conf:
-        entry, rule_options = get_rule_options(entry)
-        if rule_options.get("disabled"):
+    for item, servlist in matching_rules(hostname, conf, parse_service_extra_conf_rule):
+        if in_extraconf_servicelist(servlist, service):
+            entries.append(item)
+    return entries
+
+def parse_service_extra_conf_rule(entry):
+    if len(entry) == 3:
+        item, hostlist, servlist = entry
+        tags = []
+    elif len(entry) == 4:
+        item, tags, hostlist, servlist = entry
+    else:
+        raise MKGeneralException("Invalid entry '%r' in service configuration list: must have 3 or 4 elements" % (entry,))
+    return (item, servlist), tags, hostlist
+
+
+# Rulesets are compiled when they are used for the first time. Every
+# rule is split into its value (the part the caller is interested in),
+# its tags and its host list. The host list is compiled into a
+# dictionary of the explicit host names it contains and the positions
+# of the special entries. An index from host names to the rules that
+# name the host allows to skip all rules that cannot match a host.
+# The rules matching a host are computed only once for each ruleset.
+# A ruleset can be read with different parse functions, so both caches
+# are keyed by the id of the ruleset and the parse function.
+g_compiled_rulesets = {} # (id of ruleset, parse_rule) -> (ruleset, length, rules, index, generic rules)
+g_matching_rules    = {} # (id of ruleset, parse_rule) -> { hostname -> (list of values, error) }
+
+# Iterates over the values of all rules of a ruleset that match a host,
+# in the order of the rules. parse_rule(entry) gets a rule without the
+# rule options and returns the value, the tags and the host list of
+# the rule - or None for invalid rules to be ignored. Errors in rules
+# are raised when the iteration reaches the rule - just as if the
+# rules were processed one by one. If ignore_errors is True, invalid
+# host lists are silently skipped.
+def matching_rules(hostname, ruleset, parse_rule, ignore_errors=False):
+    values, error = rules_matching_host(hostname, ruleset, parse_rule, ignore_errors)
+    for value in values:
+        yield value
+    if error:
+        raise error
+
+def rules_matching_host(hostname, ruleset, parse_rule, ignore_errors):
+    if not ruleset:
+        return [], None
+
+    key = id(ruleset), parse_rule
+    compiled = g_compiled_rulesets.get(key)
+    if not compiled or compiled[0] is not ruleset or compiled[1] != len(ruleset):
+        compiled = compile_ruleset(ruleset, parse_rule)
+        g_compiled_rulesets[key] = compiled
+        g_matching_rules[key] = {}
+    else:
+        try:
+            return g_matching_rules[key][hostname]
+        except KeyError:
+            pass
+    rules, index, generic = compiled[2:]
+
+    candidates = index.get(hostname, [])
+    if generic:
+        candidates = list(set(candidates + generic))
+        candidates.sort()
+
+    values = []
+    error = None
+    hosttags = tags_of_host(hostname)
+    ic = None
+    for nr in candidates:
+        value, tags, explicit, specials = rules[nr]
+        if tags == None: # invalid rule, value is the exception
+            error = value
+            break
+        if not hosttags_match_taglist(hosttags, tags):
             continue
 
-        if len(entry) == 3:
-            item, hostlist, servlist = entry
-            tags = []
-        elif len(entry) == 4:
-            item, tags, hostlist, servlist = entry
+        match = explicit.get(hostname)
+        for position, special in specials:
+            if match and match[0] < position:
+                break
+            if special == '@cluster' or special == '@physical':
+                if ic == None:
+                    ic = is_cluster(hostname)
+                if (special == '@cluster') != ic:
+                    continue
+            elif special != '@all':
+                if ignore_errors:
+                    match = None
+                else:
+                    error = MKGeneralException(special)
+                break
+            match = position, True
+            break
+
+        if error:
+            break
+        elif match and match[1]:
+            values.append(value)
+
+    g_matching_rules[key][hostname] = values, error
+    return values, error
+
+def compile_ruleset(ruleset, parse_rule):
+    if len(ruleset) == 1 and ruleset[0] == "":
+        sys.stderr.write('WARNING: deprecated entry [ "" ] in host configuration list\n')
+
+    rules   = []
+    index   = {} # host name -> numbers of rules with that host as positive entry
+    generic = [] # numbers of rules that need to be checked for every host
+    for entry in ruleset:
+        try:
+            entry, rule_options = get_rule_options(entry)
+            if rule_options.get("disabled"):
+                continue
+            rule = parse_rule(entry)
+        except Exception, e:
+            generic.append(len(rules))
+            rules.append((e, None, None, None))
+            continue
+
+        if rule == None:
+            continue
+        value, tags, hostlist = rule
+
+        explicit, specials = compile_hostlist(hostlist)
+        nr = len(rules)
+        rules.append((value, tags, explicit, specials))
+        for hostname, (position, positive) in explicit.items():
+            if positive:
+                index.setdefault(hostname, []).append(nr)
+        if specials:
+            generic.append(nr)
+
+    return ruleset, len(ruleset), rules, index, generic
+
+# Compiles a host list as used by in_extraconf_hostlist() into
+# a dictionary from host name to the position of the first entry
+# of that host and whether that entry is positive - and a list of
+# the positions of the special entries '@all', '@cluster' and
+# '@physical'. Invalid entries are kept as special entries with the
+# error message. They raise an exception when they are reached.
+def compile_hostlist(hostlist):
+    # Migration help: print error if old format appears in config file
+    if len(hostlist) == 1 and hostlist[0] == "":
+        return {}, [ (-1, 'Invalid empty entry [ "" ] in configuration') ]
+
+    explicit = {}
+    specials = []
+    for position, hostentry in enumerate(hostlist):
+        if len(hostentry) == 0:
+            specials.append((position, 'Empty hostname in host list %r' % (hostlist,)))
+            break
+
+        if hostentry[0] == '@':
+            if hostentry in [ '@all', '@cluster', '@physical' ]:
+                specials.append((position, hostentry))
+            continue
+
+        # Allow negation of hostentry with prefix '!'
+        elif hostentry[0] == '!':
+            hostentry = hostentry[1:]
+            positive = False
         else:
-            raise MKGeneralException("Invalid entry '%r' in service configuration list: must have 3 or 4 elements" % (entry,))
+            positive = True
 
-        if hosttags_match_taglist(tags_of_host(hostname), tags) and \
-           in_extraconf_hostlist(hostlist, hostname) and \
-           in_extraconf_servicelist(servlist, service):
-            entries.append(item)
-    return entries
+        hostname = strip_tags(hostentry)
+        if hostname not in explicit:
+            explicit[hostname] = position, positive
+
+    return explicit, specials
 
 
 
@@ -1478,9 +1944,41 @@ def create_nagios_config(outfile = sys.stdout, hostnames = None):
     output_conf_header(outfile)
     if hostnames == None:
         hostnames = all_hosts_untagged + all_active_clusters()
+        update_all = True
+    else:
+        update_all = False
+    update_dns_cache(hostnames)
+
+    # Only hosts whose configuration inputs have changed since the last
+    # run are rendered again. All others are taken from the cache.
+    cache = read_nagios_config_cache()
+    global_fingerprint = nagios_config_global_fingerprint()
+    if cache.get("global") != global_fingerprint:
+        cache = {}
+    if update_all:
+        new_hosts = {}
+    else:
+        new_hosts = cache.get("hosts", {})
 
+    num_rendered = 0
     for hostname in hostnames:
-        create_nagios_config_host(outfile, hostname)
+        fingerprint = nagios_config_host_fingerprint(hostname)
+        cached = cache.get("hosts", {}).get(hostname)
+        if not cached or cached[0] != fingerprint:
+            fragment, defines = create_nagios_config_host_fragment(hostname)
+            cached = (fingerprint, fragment, defines)
+            num_rendered += 1
+        new_hosts[hostname] = cached
+
+        outfile.write(cached[1])
+        for to_define, names in zip(nagios_config_sets_to_define(), cached[2]):
+            to_define.update(names)
+
+    if opt_verbose:
+        sys.stderr.write("Created configuration of %d hosts, %d taken from cache.\n" %
+                         (num_rendered, len(hostnames) - num_rendered))
+    if num_rendered or len(new_hosts) != len(cache.get("hosts", {})):
+        write_nagios_config_cache({ "global" : global_fingerprint, "hosts" : new_hosts })
 
     create_nagios_config_hostgroups(outfile)
     create_nagios_config_servicegroups(outfile)
@@ -1495,6 +1993,131 @@ def create_nagios_config(outfile = sys.stdout, hostnames = None):
 
 
 
+# The Nagios configuration of each host is cached in a file together
+# with a fingerprint of everything the configuration of that host
+# depends on: the global settings (the configuration variables except
+# the per-host ones, the checks and the Check_MK modules) and the tags,
+# IP address, folder and autochecks of the host and of its cluster
+# nodes or clusters. Configuration variables are all variables that
+# exist when the configuration files are read (vars_before_config).
+nagios_config_cache_file = var_dir + "/nagios_config.cache"
+
+# Variables that only hold per-host data. They are not part of the
+# global fingerprint, the data of the hosts is part of the fingerprint
+# of the host instead.
+nagios_config_host_variables = set([ 'all_hosts', 'all_hosts_untagged', 'hosttags',
+    'ipaddresses', 'host_paths', 'host_attributes',
+    'vars_before_config', 'seen_hostnames', 'taggedhost', 'hostname', 'parts',
+    'FILE_PATH', 'FOLDER_PATH' ])
+
+# Variables of the option parsing, which also exist when the
+# configuration is read (automations read it while parsing the options)
+nagios_config_option_variables = set([ 'short_options', 'long_options',
+    'non_config_options', 'opts', 'args', 'i', 'o', 'a', 'done', 'seen_I',
+    'inventory_checks' ])
+
+def nagios_config_sets_to_define():
+    return [ hostgroups_to_define, servicegroups_to_define, contactgroups_to_define,
+             checknames_to_define, active_checks_to_define, custom_commands_to_define ]
+
+def nagios_config_global_fingerprint():
+    import md5
+    fingerprint = md5.new(check_mk_version)
+
+    filelist = glob.glob(checks_dir + "/*") + glob.glob(modules_dir + "/*.py")
+    if local_checks_dir:
+        filelist += glob.glob(local_checks_dir + "/*")
+    filelist.sort()
+    for f in filelist:
+        st = os.stat(f)
+        fingerprint.update("%s %d %d\n" % (f, st.st_mtime, st.st_size))
+
+    # Variables holding objects that cannot be marshalled are
+    # functions, modules or classes - never configuration settings.
+    for varname in sorted(vars_before_config):
+        if varname in nagios_config_host_variables \
+           or varname in nagios_config_option_variables \
+           or varname.startswith("g_") or varname.startswith("opt_") \
+           or varname not in globals():
+            continue
+        try:
+            fingerprint.update(varname + marshal.dumps(canonical_value(globals()[varname])))
+        except ValueError:
+            pass
+    return fingerprint.hexdigest()
+
+# Converts a value into a form that does not depend on the order in
+# which the entries of dictionaries and sets have been added
+def canonical_value(value):
+    t = type(value)
+    if t == dict:
+        items = [ (canonical_value(k), canonical_value(v)) for k, v in value.items() ]
+        items.sort()
+        return ("dict", items)
+    elif t == set:
+        entries = [ canonical_value(v) for v in value ]
+        entries.sort()
+        return ("set", entries)
+    elif t == list:
+        return [ canonical_value(v) for v in value ]
+    elif t == tuple:
+        return tuple([ canonical_value(v) for v in value ])
+    else:
+        return value
+
+def nagios_config_host_fingerprint(hostname):
+    import md5
+    related_hosts = [ hostname ] + (nodes_of(hostname) or []) + \
+        [ strip_tags(c) for c, nodes in clusters.items() if hostname in nodes ]
+    inputs = []
+    for host in related_hosts:
+        try:
+            ipaddress = lookup_ipaddress(host)
+        except:
+            ipaddress = None
+        inputs.append((host, host in all_hosts_untagged, tags_of_host(host), ipaddress,
+                       host_paths.get(host), read_autochecks_entries_of(host)))
+    return md5.new(marshal.dumps(canonical_value(inputs))).hexdigest()
+
+def read_nagios_config_cache():
+    try:
+        return marshal.load(file(nagios_config_cache_file))
+    except:
+        return {}
+
+def write_nagios_config_cache(cache):
+    if i_am_root():
+        return # never create files as root
+    try:
+        tmp_path = "%s.new%d" % (nagios_config_cache_file, os.getpid())
+        f = file(tmp_path, "w")
+        marshal.dump(cache, f)
+        f.close()
+        os.rename(tmp_path, nagios_config_cache_file)
+    except Exception, e:
+        if opt_debug:
+            sys.stderr.write("Cannot write %s: %s\n" % (nagios_config_cache_file, e))
+
+# Render the configuration of one host. Returns the configuration
+# and the groups, checks and commands that need to be defined for
+# this host.
+def create_nagios_config_host_fragment(hostname):
+    global hostgroups_to_define, servicegroups_to_define, contactgroups_to_define
+    global checknames_to_define, active_checks_to_define, custom_commands_to_define
+    import cStringIO
+    saved = nagios_config_sets_to_define()
+    hostgroups_to_define, servicegroups_to_define, contactgroups_to_define, \
+    checknames_to_define, active_checks_to_define, custom_commands_to_define = \
+        [ set([]) for s in saved ]
+    try:
+        outfile = cStringIO.StringIO()
+        create_nagios_config_host(outfile, hostname)
+        defines = [ list(s) for s in nagios_config_sets_to_define() ]
+    finally:
+        hostgroups_to_define, servicegroups_to_define, contactgroups_to_define, \
+        checknames_to_define, active_checks_to_define, custom_commands_to_define = saved
+    return outfile.getvalue(), defines
+
 def create_nagios_config_host(outfile, hostname):
     outfile.write("\n# ----------------------------------------------------\n")
     outfile.write("# %s\n" % hostname)
@@ -2128,6 +2751,13 @@ def do_snmp_scan(hostnamelist, check_only=False, include_state=False):
     if hostnamelist == []:
         hostnamelist = all_hosts_untagged
 
+    # Scan several hosts in parallel (like do_parallel_inventory())
+    if not check_only and max_num_processes > 1:
+        hostnamelist = [ h for h in hostnamelist if is_snmp_host(h) ]
+        if len(hostnamelist) > 1:
+            do_parallel_snmp_scan(hostnamelist)
+            return []
+
     result = []
     for hostname in hostnamelist:
         if not is_snmp_host(hostname):
@@ -2146,7 +2776,9 @@ def do_snmp_scan(hostnamelist, check_only=False, include_state=False):
 
 
 
-def make_inventory(checkname, hostnamelist, check_only=False, include_state=False):
+# If a list is given as autochecks, then the lines for the autochecks
+# file are appended to it instead of writing a new autochecks file.
+def make_inventory(checkname, hostnamelist, check_only=False, include_state=False, autochecks=None):
     try:
         inventory_function = check_info[checkname]["inventory_function"]
         if inventory_function == None:
@@ -2339,21 +2971,170 @@ def make_inventory(checkname, hostnamelist, check_only=False, include_state=Fals
         sys.stderr.write('<Interrupted>\n')
 
 
-    if not check_only:
-        if newchecks != []:
-            filename = autochecksdir + "/" + checkname + "-" + time.strftime("%Y-%m-%d_%H.%M.%S")
-            while os.path.exists(filename + ".mk"): # in case of more than one file per second and checktype...
-                filename += ".x"
-            filename += ".mk"
-            if not os.path.exists(autochecksdir):
-                os.makedirs(autochecksdir)
-            file(filename, "w").write('# %s\n[\n%s]\n' % (filename, ''.join(newchecks)))
-            sys.stdout.write('%-30s ' % (tty_cyan + tty_bold + checkname + tty_normal))
-            sys.stdout.write('%s%d new checks%s\n' % (tty_bold + tty_green, count_new, tty_normal))
+    if autochecks != None:
+        autochecks += newchecks
+    elif not check_only:
+        write_inventory_autochecks(checkname, newchecks)
 
     return newitems
 
 
+def write_inventory_autochecks(checkname, newchecks):
+    if newchecks != []:
+        convert_legacy_autochecks()
+        newchecks_of = {}
+        for line in newchecks:
+            newchecks_of.setdefault(split_autochecks_line(line)[0], []).append(line)
+        for hostname, lines in newchecks_of.items():
+            write_autochecks_lines_of(hostname, read_autochecks_lines_of(hostname) + lines)
+        sys.stdout.write('%-30s ' % (tty_cyan + tty_bold + checkname + tty_normal))
+        sys.stdout.write('%s%d new checks%s\n' % (tty_bold + tty_green, len(newchecks), tty_normal))
+
+
+# Inventory of many hosts (-I without --procs 1): each host is handled
+# by a separate process, which runs the inventory functions of all
+# check types for that host. That way the data fetched from a host is
+# shared by all inventory functions. The autochecks files are written
+# by us after all hosts are done - exactly as make_inventory() does.
+def do_parallel_inventory(checknames, hostnamelist):
+    if not hostnamelist:
+        global opt_use_cachefile
+        opt_use_cachefile = True
+        hostnamelist = all_hosts_untagged
+
+    def inventorize_host(host):
+        result = []
+        for checkname in checknames:
+            autochecks = []
+            make_inventory(checkname, [host], False, autochecks=autochecks)
+            result.append((checkname, autochecks))
+        return result
+
+    results = run_parallel(hostnamelist, inventorize_host, show_inventory_progress)
+    write_parallel_inventory(hostnamelist, results)
+
+
+def do_parallel_snmp_scan(hostnamelist):
+    def scan_host(hostname):
+        try:
+            ipaddress = lookup_ipaddress(hostname)
+        except:
+            sys.stdout.write("Cannot resolve %s into IP address. Skipping.\n" % hostname)
+            return []
+
+        result = []
+        for checkname in snmp_scan(hostname, ipaddress):
+            if opt_debug:
+                sys.stdout.write("Trying inventory for %s on %s\n" % (checkname, hostname))
+            autochecks = []
+            make_inventory(checkname, [hostname], False, autochecks=autochecks)
+            result.append((checkname, autochecks))
+        return result
+
+    results = run_parallel(hostnamelist, scan_host, show_inventory_progress)
+    write_parallel_inventory(hostnamelist, results)
+
+
+def show_inventory_progress(host, success, result):
+    if opt_verbose:
+        if success:
+            count = sum([ len(autochecks) for checkname, autochecks in result ])
+            sys.stdout.write("%s: %d new checks\n" % (host, count))
+        else:
+            sys.stdout.write("%s: %s\n" % (host, result))
+
+
+# Merge the lines for the autochecks files computed by the processes
+# of a parallel inventory and write one file for each check type
+def write_parallel_inventory(hostnamelist, results):
+    checknames = []
+    newchecks = {}
+    for host in hostnamelist:
+        success, result = results[host]
+        if not success:
+            if result:
+                sys.stderr.write("Inventory of %s failed: %s\n" % (host, result))
+            continue
+
+        for checkname, autochecks in result:
+            if checkname not in newchecks:
+                checknames.append(checkname)
+                newchecks[checkname] = []
+            for newcheck in autochecks:
+                if newcheck not in newchecks[checkname]: # clustered services
+                    newchecks[checkname].append(newcheck)
+
+    for checkname in checknames:
+        write_inventory_autochecks(checkname, newchecks[checkname])
+
+
+# Calls function(hostname) for all hosts, each one in a process of
+# its own. At most max_num_processes processes run at the same time.
+# The result of the function is sent back to us via a pipe (as repr(),
+# so it must consist of Python literals). Returns a dictionary from
+# the host name to a pair of a success flag and either the result of
+# the function or the error message. progress_function is called
+# with the same three values as soon as a host is finished. Instead
+# of host names any other literals can be used, e.g. tuples of hosts.
+def run_parallel(hostnames, function, progress_function=None):
+    import select
+    results = {}
+    todo = list(hostnames)
+    running = {} # file descriptor of pipe -> (pid, hostname, chunks of answer)
+    while todo or running:
+        while todo and len(running) < max(1, max_num_processes):
+            hostname = todo.pop(0)
+            fd_read, fd_write = os.pipe()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                os.close(fd_read)
+                try:
+                    try:
+                        answer = repr((True, function(hostname)))
+                    except SystemExit, e:
+                        answer = repr((False, ""))
+                    except Exception, e:
+                        if opt_debug:
+                            import traceback
+                            traceback.print_exc()
+                        answer = repr((False, str(e)))
+                    while answer:
+                        answer = answer[os.write(fd_write, answer):]
+                finally:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    os._exit(0)
+            os.close(fd_write)
+            running[fd_read] = (pid, hostname, [])
+
+        try:
+            readable = select.select(running.keys(), [], [])[0]
+        except select.error, e:
+            continue # interrupted by signal
+
+        for fd in readable:
+            chunk = os.read(fd, 65536)
+            if chunk:
+                running[fd][2].append(chunk)
+                continue
+
+            pid, hostname, chunks = running[fd]
+            del running[fd]
+            os.close(fd)
+            os.waitpid(pid, 0)
+            try:
+                success, result = eval("".join(chunks))
+            except:
+                success, result = False, "Process died"
+            results[hostname] = (success, result)
+            if progress_function:
+                progress_function(hostname, success, result)
+
+    return results
+
+
 def check_inventory(hostname):
     newchecks = []
     newitems = []
@@ -2407,69 +3188,217 @@ def service_ignored(hostname, checktype, service_description):
     return False
 
 
-def in_boolean_serviceconf_list(hostname, service_description, conflist):
-    for entry in conflist:
-        entry, rule_options = get_rule_options(entry)
-        if rule_options.get("disabled"):
-            continue
+def in_boolean_serviceconf_list(hostname, service_description, conflist):
+    for negate, servlist in matching_rules(hostname, conflist, parse_boolean_serviceconf_rule):
+        if in_extraconf_servicelist(servlist, service_description):
+            if opt_verbose:
+                print "Ignoring service '%s' on host %s." % (service_description, hostname)
+            return not negate
+    return False # no match. Do not ignore
+
+def parse_boolean_serviceconf_rule(entry):
+    if entry[0] == NEGATE: # this entry is logically negated
+        negate = True
+        entry = entry[1:]
+    else:
+        negate = False
+
+    if len(entry) == 2:
+        hostlist, servlist = entry
+        tags = []
+    elif len(entry) == 3:
+        tags, hostlist, servlist = entry
+    else:
+        raise MKGeneralException("Invalid entry '%r' in configuration: must have 2 or 3 elements" % (entry,))
+    return (negate, servlist), tags, hostlist
+
+
+#   +----------------------------------------------------------------------+
+#   |             _         _             _               _                |
+#   |            / \  _   _| |_ ___   ___| |__   ___  ___| | _____         |
+#   |           / _ \| | | | __/ _ \ / __| '_ \ / _ \/ __| |/ / __|        |
+#   |          / ___ \ |_| | || (_) | (__| | | |  __/ (__|   <\__ \        |
+#   |         /_/   \_\__,_|\__\___/ \___|_| |_|\___|\___|_|\_\___/        |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+
+# The autochecks are stored in one file per host: autochecksdir/HOST.mk.
+# Each file contains a list of entries (hostname, checktype, item,
+# paramstring). Clustered services are stored in the file of the
+# cluster. The autochecks of a host are read when they are needed
+# first. Files are always replaced via a temporary file.
+#
+# Older versions created one file per inventory run and check type
+# (CHECKTYPE-DATE.mk) with the checks of many hosts. Such files - and
+# other files with checks of more than one host - are still read. They
+# are converted into files per host as soon as autochecks are changed.
+# Files of hosts that are not configured anymore are ignored.
+g_autochecks_cache = {}        # hostname -> list of autochecks entries
+g_legacy_autochecks = None     # hostname -> entries from old style files
+g_legacy_autochecks_regex = re.compile(r"-\d{4}-\d\d-\d\d_\d\d\.\d\d\.\d\d(\.x)*\.mk$")
+
+def autochecks_file(hostname):
+    return "%s/%s.mk" % (autochecksdir, hostname.replace(":", "_"))
+
+def legacy_autochecks_files():
+    host_files = set([ autochecks_file(h) for h in strip_tags(all_hosts + clusters.keys()) ])
+    legacy_files = []
+    for f in glob.glob(autochecksdir + "/*.mk"):
+        if g_legacy_autochecks_regex.search(f):
+            legacy_files.append(f)
+        elif f not in host_files:
+            for line in file(f):
+                hostname = split_autochecks_line(line)[0]
+                if hostname and autochecks_file(hostname) != f:
+                    legacy_files.append(f)
+                    break
+    return legacy_files
+
+def read_autochecks_file(filename):
+    try:
+        return eval(file(filename).read())
+    except SyntaxError,e:
+        if opt_verbose:
+            sys.stderr.write("Syntax error in file %s: %s\n" % (filename, e))
+        if opt_debug:
+            sys.exit(3)
+    except Exception, e:
+        if opt_verbose:
+            sys.stderr.write("Error in file %s:\n%s\n" % (filename, e))
+        if opt_debug:
+            sys.exit(3)
+    return []
+
+# Returns the autochecks of a host. The parameters found by the inventory
+# are exchanged with those configured by the user. Also they are merged
+# with the default levels of modern dictionary based checks.
+def read_autochecks_of(hostname):
+    if hostname in g_autochecks_cache:
+        return g_autochecks_cache[hostname]
+
+    autochecks = [ (host, ct, it, compute_check_parameters(host, ct, it, par))
+                   for (host, ct, it, par) in read_autochecks_entries_of(hostname) ]
+    g_autochecks_cache[hostname] = autochecks
+    return autochecks
+
+# Returns the autochecks entries of a host as found in the files, with
+# the parameters found by the inventory
+def read_autochecks_entries_of(hostname):
+    global g_legacy_autochecks
+    if g_legacy_autochecks == None:
+        g_legacy_autochecks = {}
+        for f in legacy_autochecks_files():
+            for entry in read_autochecks_file(f):
+                g_legacy_autochecks.setdefault(entry[0], []).append(entry)
+
+    entries = g_legacy_autochecks.get(hostname, [])
+    path = autochecks_file(hostname)
+    if os.path.exists(path):
+        entries = read_autochecks_file(path) + entries
+    return entries
 
-        if entry[0] == NEGATE: # this entry is logically negated
-            negate = True
-            entry = entry[1:]
-        else:
-            negate = False
+# Forget all autochecks read so far. Needs to be called after
+# autochecks have been changed.
+def reread_autochecks():
+    global g_autochecks_cache, g_legacy_autochecks, g_check_table_cache
+    g_autochecks_cache = {}
+    g_legacy_autochecks = None
+    g_check_table_cache = {}
+
+# Returns host name and check type of a line in an autochecks file,
+# or None, None if the line contains no check. Both can be quoted
+# with ' or with ".
+def split_autochecks_line(line):
+    double_quoted = line.replace("'", '"').lstrip()
+    if double_quoted.startswith('("'):
+        splitted = double_quoted.split('"')
+        return splitted[1], splitted[3]
+    return None, None
+
+# Returns the lines of the checks in the autochecks file of a host
+def read_autochecks_lines_of(hostname):
+    path = autochecks_file(hostname)
+    if not os.path.exists(path):
+        return []
+    return [ line for line in file(path) if split_autochecks_line(line)[0] ]
 
-        if len(entry) == 2:
-            hostlist, servlist = entry
-            tags = []
-        elif len(entry) == 3:
-            tags, hostlist, servlist = entry
+# Replace the autochecks file of a host with the given lines. The
+# file is removed if there are no lines left.
+def write_autochecks_lines_of(hostname, lines, header="[\n"):
+    path = autochecks_file(hostname)
+    if not lines:
+        if os.path.exists(path):
+            if opt_verbose:
+                sys.stdout.write("Deleting %s.\n" % path)
+            os.remove(path)
+    else:
+        if not os.path.exists(autochecksdir):
+            os.makedirs(autochecksdir)
+        tmp_path = "%s.new%d" % (path, os.getpid())
+        f = file(tmp_path, "w")
+        f.write(header)
+        for line in lines:
+            f.write(line)
+        f.write("]\n")
+        f.close()
+        os.rename(tmp_path, path)
+    if hostname in g_autochecks_cache:
+        del g_autochecks_cache[hostname]
+    if hostname in g_check_table_cache:
+        del g_check_table_cache[hostname]
+
+# Convert old style autochecks files into files per host. Only the
+# files of the hosts found in the old style files are rewritten.
+def convert_legacy_autochecks():
+    legacy_files = legacy_autochecks_files()
+    if not legacy_files:
+        return
+
+    lines_of = {}
+    for f in legacy_files:
+        for line in file(f):
+            hostname = split_autochecks_line(line)[0]
+            if hostname:
+                lines_of.setdefault(hostname, []).append(line)
+
+    written = set([])
+    for hostname, lines in lines_of.items():
+        path = autochecks_file(hostname)
+        if path in legacy_files: # is replaced, not extended
+            old_lines = []
         else:
-            raise MKGeneralException("Invalid entry '%r' in configuration: must have 2 or 3 elements" % (entry,))
+            old_lines = read_autochecks_lines_of(hostname)
+        write_autochecks_lines_of(hostname, old_lines + lines)
+        written.add(path)
 
-        if hosttags_match_taglist(tags_of_host(hostname), tags) and \
-           in_extraconf_hostlist(hostlist, hostname) and \
-           in_extraconf_servicelist(servlist, service_description):
+    for f in legacy_files:
+        if f not in written:
             if opt_verbose:
-                print "Ignoring service '%s' on host %s." % (service_description, hostname)
-            return not negate
-    return False # no match. Do not ignore
-
+                sys.stdout.write("Deleting %s.\n" % f)
+            os.remove(f)
+    reread_autochecks()
 
 # Remove all autochecks of certain types of a certain host
 def remove_autochecks_of(hostname, checktypes = None): # None = all
+    convert_legacy_autochecks()
     removed = 0
-    for fn in glob.glob(autochecksdir + "/*.mk"):
-        if opt_debug:
-            sys.stdout.write("Scanning %s...\n" % fn)
-        lines = []
-        count = 0
-        for line in file(fn):
-            # hostname and check type can be quoted with ' or with "
-            double_quoted = line.replace("'", '"').lstrip()
-            if double_quoted.startswith('("'):
-                count += 1
-                splitted = double_quoted.split('"')
-                if splitted[1] != hostname or (checktypes != None and splitted[3] not in checktypes):
-                    if splitted[3] not in check_info:
-                        sys.stderr.write('Removing unimplemented check %s\n' % splitted[3])
-                        continue
-                    lines.append(line)
-                else:
-                    removed += 1
-        if len(lines) == 0:
-            if opt_verbose:
-                sys.stdout.write("Deleting %s.\n" % fn)
-            os.remove(fn)
-        elif count > len(lines):
-            if opt_verbose:
-                sys.stdout.write("Removing %d checks from %s.\n" % (count - len(lines), fn))
-            f = file(fn, "w+")
-            f.write("[\n")
-            for line in lines:
-                f.write(line)
-            f.write("]\n")
+    lines = []
+    old_lines = read_autochecks_lines_of(hostname)
+    for line in old_lines:
+        host, checktype = split_autochecks_line(line)
+        if host != hostname or (checktypes != None and checktype not in checktypes):
+            if checktype not in check_info:
+                sys.stderr.write('Removing unimplemented check %s\n' % checktype)
+                continue
+            lines.append(line)
+        else:
+            removed += 1
 
+    if len(lines) < len(old_lines):
+        if opt_verbose and lines:
+            sys.stdout.write("Removing %d checks from %s.\n" %
+                             (len(old_lines) - len(lines), autochecks_file(hostname)))
+        write_autochecks_lines_of(hostname, lines)
     return removed
 
 def remove_all_autochecks():
@@ -2477,12 +3406,7 @@ def remove_all_autochecks():
         if opt_verbose:
             sys.stdout.write("Deleting %s.\n" % f)
         os.remove(f)
-
-def reread_autochecks():
-    global checks
-    checks = checks[len(autochecks):]
-    read_all_autochecks()
-    checks = autochecks + checks
+    reread_autochecks()
 
 #   +----------------------------------------------------------------------+
 #   |          ____                                     _ _                |
@@ -2512,17 +3436,66 @@ def get_precompiled_check_table(hostname):
         precomp_table.append((checktype, item, params, description, aggr_name)) # deps not needed while checking
     return precomp_table
 
+# Host checks are precompiled in parallel processes (at most one per
+# CPU and max_num_processes), each process handling a part of the
+# hosts. Errors of single hosts do not abort the precompilation of the
+# other hosts. They are reported at the end.
 def precompile_hostchecks():
     if not os.path.exists(precompiled_hostchecks_dir):
         os.makedirs(precompiled_hostchecks_dir)
-    for host in all_active_hosts() + all_active_clusters():
+    hostnames = all_active_hosts() + all_active_clusters()
+    update_dns_cache(hostnames) # the processes cannot update the cache
+
+    # This is CPU bound work: do not use more processes than CPUs
+    try:
+        num_cpus = os.sysconf("SC_NPROCESSORS_ONLN")
+    except (ValueError, OSError):
+        num_cpus = 1
+    num_procs = min(max(1, max_num_processes), num_cpus, len(hostnames))
+    if num_procs > 1 and not opt_debug:
+        parts = [ tuple(hostnames[i::num_procs]) for i in range(num_procs) ]
+        errors = {}
+        shared_files = set([])
+        for part, (success, result) in run_parallel(parts, precompile_hostchecks_of).items():
+            if success:
+                errors.update(result[0])
+                shared_files.update(result[1])
+            else:
+                for hostname in part:
+                    errors[hostname] = result
+    else:
+        errors, shared_files = precompile_hostchecks_of(hostnames)
+
+    # Hosts that could not be precompiled keep their previous host
+    # check, which still needs its shared file
+    shared_files = set(shared_files)
+    for hostname in errors:
+        shared_file = precompiled_shared_file_of(hostname)
+        if shared_file:
+            shared_files.add(shared_file)
+    cleanup_precompiled_shared_files(shared_files)
+
+    if errors:
+        for hostname in hostnames:
+            if hostname in errors:
+                sys.stderr.write("Error precompiling checks for host %s: %s\n" %
+                                 (hostname, errors[hostname]))
+        sys.exit(5)
+
+# Returns the errors of the hosts and the shared files used by them
+def precompile_hostchecks_of(hostnames):
+    errors = {}
+    shared_files = set([])
+    for hostname in hostnames:
         try:
-            precompile_hostcheck(host)
+            shared_file = precompile_hostcheck(hostname)
+            if shared_file:
+                shared_files.add(shared_file)
         except Exception, e:
             if opt_debug:
                 raise
-            sys.stderr.write("Error precompiling checks for host %s: %s\n" % (host, e))
-            sys.exit(5)
+            errors[hostname] = str(e)
+    return errors, list(shared_files)
 
 # read python file and strip comments
 g_stripped_file_cache = {}
@@ -2537,46 +3510,29 @@ def stripped_python_file(filename):
     g_stripped_file_cache[filename] = a
     return a
 
-def precompile_hostcheck(hostname):
-    if opt_verbose:
-        sys.stderr.write("%s%s%-16s%s:" % (tty_bold, tty_blue, hostname, tty_normal))
-
-    compiled_filename = precompiled_hostchecks_dir + "/" + hostname
-    source_filename = compiled_filename + ".py"
-    try:
-        os.remove(compiled_filename)
-        os.remove(source_filename)
-    except:
-        pass
-
-    # check table, enriched with addition precompiled information.
-    check_table = get_precompiled_check_table(hostname)
-    if len(check_table) == 0:
-        if opt_verbose:
-            sys.stderr.write("(no Check_MK checks)\n")
-        return
-
-    output = file(source_filename + ".new", "w")
-    output.write("#!/usr/bin/python\n")
-    output.write("# encoding: utf-8\n")
-
-    # Self-compile: replace symlink with precompiled python-code, if
-    # we are run for the first time
-    if delay_precompile:
-        output.write("""
-import os
-if os.path.islink(%(dst)r):
-    import py_compile
-    os.remove(%(dst)r)
-    py_compile.compile(%(src)r, %(dst)r, %(dst)r, True)
-    os.chmod(%(dst)r, 0755)
-
-""" % { "src" : source_filename, "dst" : compiled_filename })
-
-    output.write(stripped_python_file(modules_dir + "/check_mk_base.py"))
+# The code of check_mk_base.py, snmp.py and of the check plugins is the
+# same for all hosts using the same set of check plugins. It is compiled
+# only once into a file in precompiled_hostchecks_dir/.shared, which is
+# named after the checksum of its source code. The host checks execute
+# the compiled code from that file. They themselves only contain the
+# data of their host: the check table, IP addresses and host_data.
+def precompiled_shared_dir():
+    return precompiled_hostchecks_dir + "/.shared"
+
+# Functions of the host check that return a value of the host. Their
+# values are kept in the dictionary host_data in the host check.
+precompiled_host_functions = [ 'is_cluster', 'is_snmp_host', 'is_tcp_host',
+    'snmp_walk_command', 'is_usewalk_host', 'host_is_aggregated',
+    'agent_port_of', 'snmp_port_spec', 'get_snmp_character_encoding' ]
+precompiled_snmp_host_functions = [ 'snmp_credentials_of', 'is_bulkwalk_host',
+    'is_snmpv2c_host', 'snmp_timing_of' ]
+
+def precompile_shared_code(need_snmp_module, needed_check_types, filenames):
+    import md5
+    output = [ stripped_python_file(modules_dir + "/check_mk_base.py") ]
 
     # initialize global variables
-    output.write("""
+    output.append("""
 # very simple commandline parsing: only -v is supported
 opt_verbose = '-v' in sys.argv
 opt_debug   = False
@@ -2586,7 +3542,7 @@ no_inventory_possible = None
 """)
 
     # Compile in all neccessary global variables
-    output.write("\n# Global variables\n")
+    output.append("\n# Global variables\n")
     for var in [ 'check_mk_version', 'tcp_connect_timeout', 'agent_min_version',
                  'perfdata_format', 'aggregation_output_format',
                  'aggr_summary_hostname', 'nagios_command_pipe_path',
@@ -2595,11 +3551,109 @@ no_inventory_possible = None
                  'snmpwalks_dir', 'check_mk_basedir', 'nagios_user',
                  'www_group', 'cluster_max_cachefile_age', 'check_max_cachefile_age',
                  'simulation_mode', 'agent_simulator', 'aggregate_check_mk', 'debug_log',
+                 'use_inline_snmp', 'counters_max_age', 'max_num_connections',
                  ]:
-        output.write("%s = %r\n" % (var, globals()[var]))
+        output.append("%s = %r\n" % (var, globals()[var]))
 
-    output.write("\n# Checks for %s\n\n" % hostname)
-    output.write("def get_sorted_check_table(hostname):\n    return %r\n\n" % check_table)
+    if need_snmp_module:
+        output.append(stripped_python_file(modules_dir + "/snmp.py"))
+
+    if agent_simulator:
+        output.append(stripped_python_file(modules_dir + "/agent_simulator.py"))
+
+    output.append("check_info = {}\n" +
+                 "check_includes = {}\n" +
+                 "precompile_params = {}\n" +
+                 "factory_settings = {}\n" +
+                 "checkgroup_of = {}\n" +
+                 "check_config_variables = []\n" +
+                 "check_default_levels = {}\n" +
+                 "snmp_info = {}\n" +
+                 "snmp_scan_functions = {}\n")
+
+    for filename in filenames:
+        output.append("# %s\n" % filename)
+        output.append(stripped_python_file(filename))
+        output.append("\n\n")
+
+    # Make sure all checks are converted to the new API
+    output.append("convert_check_info()\n")
+
+    # Parameters for checks: Default values are defined in checks/*. The
+    # variables might be overridden by the user in main.mk. We need
+    # to set the actual values of those variables here. Otherwise the users'
+    # settings would get lost. But we only need to set those variables that
+    # influence the check itself - not those needed during inventory.
+    for var in check_config_variables:
+        output.append("%s = %r\n" % (var, eval(var)))
+
+    # The same for those checks that use the new API
+    for check_type in needed_check_types:
+        for var in check_info[check_type].get("check_config_variables", []):
+            output.append("%s = %r\n" % (var, eval(var)))
+
+    # Functions returning the data of the host
+    host_functions = precompiled_host_functions
+    if need_snmp_module:
+        host_functions = host_functions + precompiled_snmp_host_functions
+    for funcname in host_functions:
+        output.append("def %s(hostname):\n    return host_data[%r]\n\n" % (funcname, funcname))
+    output.append("def lookup_ipaddress(hostname):\n    return ipaddresses.get(hostname)\n\n")
+    output.append("def get_datasource_program(hostname, ipaddress):\n"
+                  "    return host_data['datasource_programs'][hostname]\n\n")
+
+    source = "".join(output)
+    compiled_filename = precompiled_shared_dir() + "/" + md5.new(source).hexdigest()
+    if not os.path.exists(compiled_filename):
+        if not os.path.exists(precompiled_shared_dir()):
+            try:
+                os.makedirs(precompiled_shared_dir())
+            except OSError:
+                pass # created by another process in the meantime
+        # Write via temporary files: several processes might do this
+        # at the same time
+        tmp_suffix = ".new%d" % os.getpid()
+        file(compiled_filename + ".py" + tmp_suffix, "w").write(source)
+        os.rename(compiled_filename + ".py" + tmp_suffix, compiled_filename + ".py")
+        code = compile(source, compiled_filename + ".py", "exec")
+        marshal.dump(code, file(compiled_filename + tmp_suffix, "w"))
+        os.rename(compiled_filename + tmp_suffix, compiled_filename)
+    return compiled_filename
+
+# Returns the shared file executed by the existing host check of a host
+def precompiled_shared_file_of(hostname):
+    try:
+        for line in file(precompiled_hostchecks_dir + "/" + hostname + ".py"):
+            if line.startswith("exec marshal.load(file("):
+                return eval(line.strip()[23:-2])
+    except IOError:
+        pass
+
+# Remove shared code that is not used by any host check anymore
+def cleanup_precompiled_shared_files(used_files):
+    for f in glob.glob(precompiled_shared_dir() + "/*"):
+        if f not in used_files and f[:-3] not in used_files:
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+
+def precompile_hostcheck(hostname):
+    if opt_verbose:
+        sys.stderr.write("%s%s%-16s%s:" % (tty_bold, tty_blue, hostname, tty_normal))
+
+    compiled_filename = precompiled_hostchecks_dir + "/" + hostname
+    source_filename = compiled_filename + ".py"
+
+    # check table, enriched with addition precompiled information.
+    check_table = get_precompiled_check_table(hostname)
+    if len(check_table) == 0:
+        for f in [ compiled_filename, source_filename ]:
+            if os.path.lexists(f):
+                os.remove(f)
+        if opt_verbose:
+            sys.stderr.write("(no Check_MK checks)\n")
+        return
 
     # Do we need to load the SNMP module? This is the case, if the host
     # has at least one SNMP based check. Also collect the needed check
@@ -2616,15 +3670,11 @@ no_inventory_possible = None
         if check_uses_snmp(check_type):
             need_snmp_module = True
 
-    if need_snmp_module:
-        output.write(stripped_python_file(modules_dir + "/snmp.py"))
-
-    if agent_simulator:
-        output.write(stripped_python_file(modules_dir + "/agent_simulator.py"))
-
     # check info table
     # We need to include all those plugins that are referenced in the host's
     # check table
+    # Sorted, so that hosts with the same check types use the same code
+    needed_check_types = sorted(needed_check_types)
     filenames = []
     for check_type in needed_check_types:
         basename = check_type.split(".")[0]
@@ -2647,40 +3697,80 @@ no_inventory_possible = None
         if path not in filenames:
             filenames.append(path)
 
+    shared_filename = precompile_shared_code(need_snmp_module, needed_check_types, filenames)
+    if opt_verbose:
+        for filename in filenames:
+            sys.stderr.write(" %s%s%s" % (tty_green, filename.split('/')[-1], tty_normal))
 
-    output.write("check_info = {}\n" +
-                 "check_includes = {}\n" +
-                 "precompile_params = {}\n" +
-                 "factory_settings = {}\n" +
-                 "checkgroup_of = {}\n" +
-                 "check_config_variables = []\n" +
-                 "check_default_levels = {}\n" +
-                 "snmp_info = {}\n" +
-                 "snmp_scan_functions = {}\n")
+    output = file(source_filename + ".new", "w")
+    output.write("#!/usr/bin/python\n")
+    output.write("# encoding: utf-8\n")
 
-    for filename in filenames:
-        output.write("# %s\n" % filename)
-        output.write(stripped_python_file(filename))
-        output.write("\n\n")
-        if opt_verbose:
-            sys.stderr.write(" %s%s%s" % (tty_green, filename.split('/')[-1], tty_normal))
+    # Self-compile: replace symlink with precompiled python-code, if
+    # we are run for the first time
+    if delay_precompile:
+        output.write("""
+import os
+if os.path.islink(%(dst)r):
+    import py_compile
+    os.remove(%(dst)r)
+    py_compile.compile(%(src)r, %(dst)r, %(dst)r, True)
+    os.chmod(%(dst)r, 0755)
 
-    # Make sure all checks are converted to the new API
-    output.write("convert_check_info()\n")
+""" % { "src" : source_filename, "dst" : compiled_filename })
+
+    # Let the check helper do the actual work, if it is running. If it
+    # is not reachable, the host check is executed by ourselves.
+    if use_check_helper:
+        if is_cluster(hostname):
+            try:
+                request = "%s %s\n" % (hostname, lookup_ipaddress(hostname))
+            except:
+                request = hostname + "\n"
+        else:
+            request = "%s %s\n" % (hostname, lookup_ipaddress(hostname))
+        output.write("""
+import sys, socket
+if '-v' not in sys.argv and '-n' not in sys.argv:
+    try:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(%(socket)r)
+        s.sendall(%(request)r)
+        response = ""
+        while True:
+            chunk = s.recv(4096)
+            if not chunk:
+                break
+            response += chunk
+        status, output = response.split(" ", 1)
+        sys.stdout.write(output)
+        sys.exit(int(status))
+    except (socket.error, ValueError):
+        pass
+
+""" % { "socket" : check_helper_socket, "request" : request })
+
+    # Runtime and check plugins shared with other host checks
+    output.write("import marshal\n")
+    output.write("exec marshal.load(file(%r))\n" % shared_filename)
+
+    output.write("\n# Checks for %s\n\n" % hostname)
+    output.write("def get_sorted_check_table(hostname):\n    return %r\n\n" % check_table)
+
+    # The host check contains nothing but the data of the host
+    host_data = {}
+    for funcname in precompiled_host_functions:
+        host_data[funcname] = globals()[funcname](hostname)
+    if need_snmp_module:
+        for funcname in precompiled_snmp_host_functions:
+            host_data[funcname] = globals()[funcname](hostname)
 
     # handling of clusters
     if is_cluster(hostname):
         output.write("clusters = { %r : %r }\n" %
                      (hostname, nodes_of(hostname)))
-        output.write("def is_cluster(hostname):\n    return True\n\n")
     else:
-        output.write("clusters = {}\ndef is_cluster(hostname):\n    return False\n\n")
-
-    # snmp hosts
-    output.write("def is_snmp_host(hostname):\n   return %r\n\n" % is_snmp_host(hostname))
-    output.write("def is_tcp_host(hostname):\n   return %r\n\n" % is_tcp_host(hostname))
-    output.write("def snmp_walk_command(hostname):\n   return %r\n\n" % snmp_walk_command(hostname))
-    output.write("def is_usewalk_host(hostname):\n   return %r\n\n" % is_usewalk_host(hostname))
+        output.write("clusters = {}\n")
 
     # IP addresses
     needed_ipaddresses = {}
@@ -2700,8 +3790,7 @@ no_inventory_possible = None
         needed_ipaddresses[hostname] = ipaddress
         nodes = [ (hostname, ipaddress) ]
 
-    output.write("ipaddresses = %r\n\n" % needed_ipaddresses)
-    output.write("def lookup_ipaddress(hostname):\n   return ipaddresses.get(hostname)\n\n");
+    output.write("ipaddresses = %r\n" % needed_ipaddresses)
 
     # datasource programs. Is this host relevant?
     # ACHTUNG: HIER GIBT ES BEI CLUSTERN EIN PROBLEM!! WIR MUESSEN DIE NODES
@@ -2711,32 +3800,9 @@ no_inventory_possible = None
     for node, ipa in nodes:
         program = get_datasource_program(node, ipa)
         dsprogs[node] = program
-    output.write("def get_datasource_program(hostname, ipaddress):\n" +
-                 "    return %r[hostname]\n\n" % dsprogs)
-
-    # aggregation
-    output.write("def host_is_aggregated(hostname):\n    return %r\n\n" % host_is_aggregated(hostname))
-
-    # TCP and SNMP port of agent
-    output.write("def agent_port_of(hostname):\n    return %d\n\n" % agent_port_of(hostname))
-    output.write("def snmp_port_spec(hostname):\n    return %r\n\n" % snmp_port_spec(hostname))
-
-    # SNMP character encoding
-    output.write("def get_snmp_character_encoding(hostname):\n    return %r\n\n"
-      % get_snmp_character_encoding(hostname))
-
-    # Parameters for checks: Default values are defined in checks/*. The
-    # variables might be overridden by the user in main.mk. We need
-    # to set the actual values of those variables here. Otherwise the users'
-    # settings would get lost. But we only need to set those variables that
-    # influence the check itself - not those needed during inventory.
-    for var in check_config_variables:
-        output.write("%s = %r\n" % (var, eval(var)))
+    host_data["datasource_programs"] = dsprogs
 
-    # The same for those checks that use the new API
-    for check_type in needed_check_types:
-        for var in check_info[check_type].get("check_config_variables", []):
-            output.write("%s = %r\n" % (var, eval(var)))
+    output.write("host_data = %r\n" % host_data)
 
     # perform actual check
     output.write("do_check(%r, %r)\n" % (hostname, ipaddress))
@@ -2746,11 +3812,12 @@ no_inventory_possible = None
     # code has not changed. The Python compilation is the most costly
     # operation here.
     if os.path.exists(source_filename):
-        if file(source_filename).read() == file(source_filename + ".new").read():
+        if file(source_filename).read() == file(source_filename + ".new").read() \
+           and os.path.lexists(compiled_filename):
             if opt_verbose:
                 sys.stderr.write(" (%s is unchanged)\n" % source_filename)
             os.remove(source_filename + ".new")
-            return
+            return shared_filename
         elif opt_verbose:
             sys.stderr.write(" (new content)")
 
@@ -2765,6 +3832,7 @@ no_inventory_possible = None
 
     if opt_verbose:
         sys.stderr.write(" ==> %s.\n" % compiled_filename)
+    return shared_filename
 
 
 #   +----------------------------------------------------------------------+
@@ -3440,6 +4508,7 @@ def do_snmpwalk_on(hostname, filename):
             sys.stdout.write("%d variables.\n" % count)
 
     out.close()
+    compile_snmpwalk(filename)
     if opt_verbose:
         sys.stdout.write("Successfully Wrote %s%s%s.\n" % (tty_bold, filename, tty_normal))
 
@@ -3689,6 +4758,8 @@ def usage():
  check_mk --snmpwalk HOST1 HOST2 ...       Do snmpwalk on host
  check_mk --snmpget OID HOST1 HOST2 ...    Fetch single OIDs and output them
  check_mk --scan-parents [HOST1 HOST2...]  autoscan parents, create conf.d/parents.mk
+ check_mk --check-helper                   run check helper for fast host checks
+ check_mk --update-dns-cache               resolve all host names again
  check_mk -P, --package COMMAND            do package operations
  check_mk --localize COMMAND               do localization operations
  check_mk -V, --version                    print version
@@ -3708,7 +4779,8 @@ OPTIONS:
                  prevents DNS lookups.
   --usewalk      use snmpwalk stored with --snmpwalk
   --debug        never catch Python exceptions
-  --procs N      start up to N processes in parallel during --scan-parents
+  --procs N      start up to N processes in parallel during --scan-parents,
+                 inventory (-I), precompiling (-C) and DNS lookups
   --checks A,..  restrict checks/inventory to specified checks (tcp/snmp/check type)
 
 NOTES:
@@ -3788,6 +4860,19 @@ NOTES:
   hosts's parents. It creates the file conf.d/parents.mk which
   defines gateway hosts and parent declarations.
 
+  --check-helper starts a process that keeps the configuration and
+  all checks in memory and executes host checks in a pool of
+  %d processes (check_helper_processes). Precompiled host checks
+  send their work to that process if use_check_helper is True.
+  It is reloaded with -R, -O and -C or by sending it a SIGHUP.
+  The socket is %s.
+
+  --update-dns-cache resolves the names of all hosts without a
+  configured IP address and stores the addresses in %s.
+  These are used by all further calls of check_mk for
+  dns_cache_max_age seconds. Failed lookups are retried after
+  dns_cache_negative_max_age seconds.
+
   Nagios can call check_mk without options and the hostname and its IP
   address as arguments. Much faster is using precompiled host checks,
   though.
@@ -3796,6 +4881,9 @@ NOTES:
 """ % (check_mk_configfile,
        precompiled_hostchecks_dir,
        snmpwalks_dir,
+       check_helper_processes,
+       check_helper_socket,
+       dns_cache_file,
        )
 
 
@@ -3816,6 +4904,23 @@ def do_precompile_hostchecks():
     sys.stdout.flush()
     precompile_hostchecks()
     sys.stdout.write(tty_ok + "\n")
+    reload_check_helper()
+
+
+# Make a running check helper read in the new configuration
+def reload_check_helper():
+    try:
+        pid = int(file(check_helper_socket + ".pid").read())
+    except:
+        return # not running
+
+    sys.stdout.write("Reloading check helper...")
+    sys.stdout.flush()
+    try:
+        os.kill(pid, signal.SIGHUP)
+        sys.stdout.write(tty_ok + "\n")
+    except Exception, e:
+        sys.stdout.write("not running (%s)\n" % e)
 
 
 def do_update():
@@ -3940,9 +5045,8 @@ def do_donation():
 def do_cleanup_autochecks():
     # 1. Read in existing autochecks
     hostdata = {}
-    os.chdir(autochecksdir)
     checks = 0
-    for fn in glob.glob("*.mk"):
+    for fn in glob.glob(autochecksdir + "/*.mk"):
         if opt_debug:
             sys.stdout.write("Scanning %s...\n" % fn)
         for line in file(fn):
@@ -3961,21 +5065,17 @@ def do_cleanup_autochecks():
     newfiles = set([])
     for host, lines in hostdata.items():
         lines.sort()
-        fn = host.replace(":","_") + ".mk"
+        fn = autochecks_file(host)
         if opt_verbose:
-            sys.stdout.write("Writing %s: %d checks\n" % (fn, len(lines)))
+            sys.stdout.write("Writing %s: %d checks\n" % (os.path.basename(fn), len(lines)))
         newfiles.add(fn)
-        f = file(fn, "w+")
-        f.write("[\n")
-        for line in lines:
-            f.write(line)
-        f.write("]\n")
+        write_autochecks_lines_of(host, lines)
 
     # 3. Remove obsolete files
-    for f in glob.glob("*.mk"):
+    for f in glob.glob(autochecksdir + "/*.mk"):
         if f not in newfiles:
             if opt_verbose:
-                sys.stdout.write("Deleting %s\n" % f)
+                sys.stdout.write("Deleting %s\n" % os.path.basename(f))
             os.remove(f)
 
 def find_bin_in_path(prog):
@@ -4293,7 +5393,7 @@ def cmp_config_paths(a, b):
            cmp(pa, pb)
 
 
-def read_config_files(with_autochecks=True, with_conf_d=True):
+def read_config_files(with_conf_d=True):
     global vars_before_config, final_mk, local_mk, checks
 
     # Initialize dictionary-type default levels variables
@@ -4324,6 +5424,9 @@ def read_config_files(with_autochecks=True, with_conf_d=True):
     FILE_PATH = None
     FOLDER_PATH = None
 
+    global g_config_files
+    g_config_files = list_of_files
+
     vars_before_config = all_nonfunction_vars()
     for _f in list_of_files:
         # Hack: during parent scan mode we must not read in old version of parents.mk!
@@ -4405,11 +5508,6 @@ def read_config_files(with_autochecks=True, with_conf_d=True):
             static.append((taglist, hostlist, checktype, item, params))
     checks = static + checks
 
-    # Read autochecks and append them to explicit checks
-    if with_autochecks:
-        read_all_autochecks()
-        checks = autochecks + checks
-
     # Check for invalid configuration variables
     vars_after_config = all_nonfunction_vars()
     ignored_variables = set(['vars_before_config', 'autochecks', 'parts',
@@ -4460,10 +5558,81 @@ def read_config_files(with_autochecks=True, with_conf_d=True):
         execfile(modules_dir + "/agent_simulator.py", globals(), globals())
 
 
+# The parameters computed for the autochecks are cached - also between
+# runs in check_parameters_cache_file. The parameters depend on the
+# check type, the item, the parameters from the inventory and the
+# rules in check_parameters and checkgroup_parameters matching the
+# host - but not on the host itself. So hosts with the same rules share
+# the cache entries (and the parameter objects, which must never be
+# modified). The cache file is dropped when a configuration file or
+# a check has changed.
+check_parameters_cache_file = var_dir + "/check_parameters.cache"
+g_config_files = [] # set by read_config_files()
+g_check_parameters_cache = None # (checktype, item, params, rules) -> parameters
+g_check_parameters_cache_changed = False
+
+def config_files_fingerprint():
+    import md5
+    fingerprint = md5.new(check_mk_version)
+    filelist = g_config_files + glob.glob(checks_dir + "/*") + glob.glob(modules_dir + "/*.py")
+    if local_checks_dir:
+        filelist += glob.glob(local_checks_dir + "/*")
+    for f in filelist:
+        try:
+            st = os.stat(f)
+            fingerprint.update("%s %d %d\n" % (f, st.st_mtime, st.st_size))
+        except OSError:
+            pass
+    return fingerprint.hexdigest()
+
+def read_check_parameters_cache():
+    global g_check_parameters_cache
+    try:
+        fingerprint, cache = marshal.load(file(check_parameters_cache_file))
+        if fingerprint != config_files_fingerprint():
+            cache = {}
+    except:
+        cache = {}
+    g_check_parameters_cache = cache
+
+def write_check_parameters_cache():
+    if not g_check_parameters_cache_changed or i_am_root():
+        return # never create files as root
+    try:
+        data = marshal.dumps((config_files_fingerprint(), g_check_parameters_cache))
+        tmp_path = "%s.new%d" % (check_parameters_cache_file, os.getpid())
+        file(tmp_path, "w").write(data)
+        os.rename(tmp_path, check_parameters_cache_file)
+    except Exception, e:
+        # ValueError: parameters that cannot be marshalled
+        if opt_debug:
+            sys.stderr.write("Cannot write %s: %s\n" % (check_parameters_cache_file, e))
+
+# Returns the key for the parameter cache or None, if there is an
+# error in the rules (which is raised by computing the parameters).
+def check_parameters_cache_key(host, checktype, item, params):
+    checkgroup = check_info[checktype]["group"]
+    group_rules = []
+    if checkgroup:
+        rules = checkgroup_parameters.get(checkgroup)
+        if rules != None:
+            if item == None:
+                group_rules, error = rules_matching_host(host, rules, parse_host_extra_conf_rule, False)
+            else:
+                group_rules, error = rules_matching_host(host, rules, parse_service_extra_conf_rule, False)
+            if error:
+                return None
+
+    param_rules, error = rules_matching_host(host, check_parameters, parse_service_extra_conf_rule, False)
+    if error:
+        return None
+    return checktype, item, repr(params), repr(group_rules), repr(param_rules)
+
 # Compute parameters for a check honoring factory settings,
 # default settings of user in main.mk, check_parameters[] and
 # the values code in autochecks (given as parameter params)
 def compute_check_parameters(host, checktype, item, params):
+    global g_check_parameters_cache_changed
     if checktype not in check_info: # handle vanished checktype
         return None
 
@@ -4472,6 +5641,21 @@ def compute_check_parameters(host, checktype, item, params):
     if def_levels_varname:
         vars_before_config.add(def_levels_varname)
 
+    key = check_parameters_cache_key(host, checktype, item, params)
+    if key == None:
+        return compute_check_parameters_of(host, checktype, item, params, def_levels_varname)
+
+    if g_check_parameters_cache == None:
+        read_check_parameters_cache()
+    try:
+        params = g_check_parameters_cache[key]
+    except KeyError:
+        params = compute_check_parameters_of(host, checktype, item, params, def_levels_varname)
+        g_check_parameters_cache[key] = params
+        g_check_parameters_cache_changed = True
+    return params
+
+def compute_check_parameters_of(host, checktype, item, params, def_levels_varname):
     # Handle case where parameter is None but the type of the
     # default value is a dictionary. This is for example the
     # case if a check type has gotten parameters in a new version
@@ -4536,32 +5720,6 @@ def get_checkgroup_parameters(host, checktype, item):
         return service_extra_conf(host, str(item), rules)
 
 
-# read automatically generated checks. They are prepended to the check
-# table: explicit user defined checks override automatically generated
-# ones. Do not read in autochecks, if check_mk is called as module.
-def read_all_autochecks():
-    global autochecks
-    autochecks = []
-    for f in glob.glob(autochecksdir + '/*.mk'):
-        try:
-            autochecks += eval(file(f).read())
-        except SyntaxError,e:
-            if opt_verbose:
-                sys.stderr.write("Syntax error in file %s: %s\n" % (f, e))
-            if opt_debug:
-                sys.exit(3)
-        except Exception, e:
-            if opt_verbose:
-                sys.stderr.write("Error in file %s:\n%s\n" % (f, e))
-            if opt_debug:
-                sys.exit(3)
-
-    # Exchange inventorized check parameters with those configured by
-    # the user. Also merge with default levels for modern dictionary based checks.
-    autochecks = [ (host, ct, it, compute_check_parameters(host, ct, it, par))
-                   for (host, ct, it, par) in autochecks ]
-
-
 def output_profile():
     if g_profile:
         g_profile.dump_stats(g_profile_path)
@@ -4574,6 +5732,10 @@ def output_profile():
         os.chmod(show_profile, 0755)
 
         sys.stderr.write("Profile '%s' written. Please run %s.\n" % (g_profile_path, show_profile))
+        if g_checks_load_stats:
+            sys.stderr.write("Loaded %d check files (%d from cache) in %.3f sec.\n" % g_checks_load_stats)
+        if g_config_read_time:
+            sys.stderr.write("Startup until configuration was read: %.3f sec.\n" % (g_config_read_time - g_startup_time))
 
 #   +----------------------------------------------------------------------+
 #   |                        __  __       _                                |
@@ -4597,7 +5759,8 @@ if __name__ == "__main__":
                      "snmpget=", "profile",
                      "no-cache", "update", "restart", "reload", "dump", "fake-dns=",
                      "man", "nowiki", "config-check", "backup=", "restore=",
-                     "check-inventory=", "paths", "cleanup-autochecks", "checks=" ]
+                     "check-inventory=", "paths", "cleanup-autochecks", "checks=",
+                     "check-helper", "update-dns-cache" ]
 
     non_config_options = ['-L', '--list-checks', '-P', '--package', '-M',
                           '--man', '-V', '--version' ,'-h', '--help', '--automation', ]
@@ -4613,6 +5776,7 @@ if __name__ == "__main__":
     # by a broken configuration
     if len(set.intersection(set(non_config_options), [o[0] for o in opts])) == 0:
         read_config_files()
+    g_config_read_time = time.time()
 
     done = False
     seen_I = 0
@@ -4674,6 +5838,7 @@ if __name__ == "__main__":
                 done = True
             elif o in [ '-C', '--compile' ]:
                 precompile_hostchecks()
+                reload_check_helper()
                 done = True
             elif o in [ '-U', '--update' ] :
                 do_update()
@@ -4753,6 +5918,13 @@ if __name__ == "__main__":
             elif o == '--notify':
                 do_notify(args)
                 done = True
+            elif o == '--check-helper':
+                execfile(modules_dir + "/check_helper.py")
+                do_check_helper()
+                done = True
+            elif o == '--update-dns-cache':
+                do_update_dns_cache()
+                done = True
 
 
     except MKGeneralException, e:
@@ -4819,8 +5991,18 @@ if __name__ == "__main__":
             do_snmp_scan(hostnames)
             checknames = inventorable_checktypes("tcp")
 
-        for checkname in checknames:
-            make_inventory(checkname, hostnames, False)
+        # Contact all agents in parallel before doing the inventory
+        if not opt_no_tcp and [ c for c in checknames if not check_uses_snmp(c) ]:
+            if not hostnames:
+                opt_use_cachefile = True # like make_inventory() does
+            prefetch_agent_infos([ h for h in hostnames or all_hosts_untagged if not is_cluster(h) ],
+                                 inventory_max_cachefile_age)
+
+        if max_num_processes > 1 and len(hostnames) != 1:
+            do_parallel_inventory(checknames, hostnames)
+        else:
+            for checkname in checknames:
+                make_inventory(checkname, hostnames, False)
 
         # -u, --cleanup-autochecks called in stand alone mode
         if opt_cleanup_autochecks or always_cleanup_autochecks:
@@ -4833,6 +6015,8 @@ if __name__ == "__main__":
 
 
     if done:
+        write_check_parameters_cache()
+        write_dns_cache()
         output_profile()
         sys.exit(0)
     elif len(args) == 0 or len(args) > 2:
@@ -4859,5 +6043,8 @@ if __name__ == "__main__":
         else:
             check_types = None
 
-        do_check(hostname, ipaddress, check_types)
+        try:
+            do_check(hostname, ipaddress, check_types)
+        finally:
+            write_dns_cache() # might have resolved the nodes of a cluster
 
@@ -24,7 +24,7 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
-import socket, os, sys, time, re, signal, math, tempfile
+import socket, os, sys, time, re, signal, math, tempfile, marshal, select
 
 # Python 2.3 does not have 'set' in normal namespace.
 # But it can be imported from 'sets'
@@ -81,16 +81,23 @@ g_dns_cache                  = {}
 g_infocache                  = {} # In-memory cache of host info.
 g_agent_already_contacted    = {} # do we have agent data from this host?
 g_counters                   = {} # storing counters of one host
+g_counters_loaded            = {} # counters as read from the file (for detecting changes)
+g_counters_updated           = {} # time of last change of each counter
 g_hostname                   = "unknown" # Host currently being checked
 g_aggregated_service_results = {}   # store results for later submission
 compiled_regexes             = {}   # avoid recompiling regexes
 nagios_command_pipe          = None # Filedescriptor to open nagios command pipe.
 checkresult_file_fd          = None
 checkresult_file_path        = None
+g_submission_buffer          = []   # results of the current host run, submitted at once
 g_single_oid_hostname        = None
 g_single_oid_cache           = {}
 g_broken_snmp_hosts          = set([])
 g_broken_agent_hosts         = set([])
+g_counters_cache             = None # in-memory copy of counters of all hosts (check helper)
+g_prefetched_agent_infos     = {}   # hostname -> agent output or MKAgentError
+g_inline_snmp_cache          = {}   # hostname -> column OID -> rows (inline SNMP)
+g_inline_snmp_sessions       = {}   # hostname -> SNMP session (inline SNMP)
 
 
 # variables set later by getopt
@@ -265,6 +272,10 @@ def get_host_info(hostname, ipaddress, checkname):
         global opt_use_cachefile
         opt_use_cachefile = True
 	is_snmp_error = False
+
+        # Contact the agents of all nodes at once, not one after the other
+        prefetch_agent_infos(nodes, cluster_max_cachefile_age)
+
         for node in nodes:
             # If an error with the agent occurs, we still can (and must)
             # try the other node.
@@ -330,6 +341,10 @@ def get_realhost_info(hostname, ipaddress, check_type, max_cache_age):
 	if hostname in g_broken_snmp_hosts:
 	    raise MKSNMPError("")
 
+        # With inline SNMP the data of all SNMP checks is fetched at once
+        if use_inline_snmp_for(hostname):
+            inline_snmp_prefetch(hostname, ipaddress, check_type.split(".")[0])
+
         # New in 1.1.3: oid_info can now be a list: Each element
         # of that list is interpreted as one real oid_info, fetches
         # a separate snmp table. The overall result is then the list
@@ -360,8 +375,7 @@ def get_realhost_info(hostname, ipaddress, check_type, max_cache_age):
     elif len(output) < 16:
         raise MKAgentError("Too short output from agent: '%s'" % output)
 
-    lines = [ l.strip() for l in output.split('\n') ]
-    info = parse_info(lines)
+    info = AgentSections(output)
     store_cached_hostinfo(hostname, info)
     return info.get(check_type, []) # return only data for specified check
 
@@ -420,23 +434,79 @@ def get_agent_info(hostname, ipaddress, max_cache_age):
         if hostname in g_broken_agent_hosts:
             raise MKAgentError("")
 
-        # If the host ist listed in datasource_programs the data from
-        # that host is retrieved by calling an external program (such
-        # as ssh or rsy) instead of a TCP connect.
-        commandline = get_datasource_program(hostname, ipaddress)
-        if commandline:
-            output = get_agent_info_program(commandline)
-        else:
-            output = get_agent_info_tcp(hostname, ipaddress)
+        # Has the output already been fetched by prefetch_agent_infos()?
+        # It is already written to the cache file then.
+        prefetched = g_prefetched_agent_infos.pop(hostname, None)
+        if isinstance(prefetched, MKAgentError):
+            raise prefetched
+        elif prefetched != None:
+            output = prefetched
 
-        # Got new data? Write to cache file
-        write_cache_file(hostname, output)
+        else:
+            lock = lock_agent_cache(hostname)
+            try:
+                # While we were waiting for the lock, another process
+                # might have fetched the data already
+                if lock:
+                    output = read_cache_file(hostname, max_cache_age)
+
+                if not output:
+                    # If the host ist listed in datasource_programs the data from
+                    # that host is retrieved by calling an external program (such
+                    # as ssh or rsy) instead of a TCP connect.
+                    commandline = get_datasource_program(hostname, ipaddress)
+                    if commandline:
+                        output = get_agent_info_program(commandline)
+                    else:
+                        output = get_agent_info_tcp(hostname, ipaddress)
+
+                    # Got new data? Write to cache file
+                    write_cache_file(hostname, output)
+            finally:
+                unlock_agent_cache(lock)
 
     if agent_simulator:
         output = agent_simulator_process(output)
 
     return output
 
+# Processes that need the agent output of the same host - for example
+# the checks of several clusters sharing a node - take turns: the first
+# one holds a lock on the host while contacting the agent, the others
+# wait for it and then read its cache file. The lock is released by the
+# kernel when the process dies. Locking is only done when cache files
+# are used. Returns the opened lock file, None if no locking is done
+# and False if the host is locked by another process and blocking is
+# False.
+def lock_agent_cache(hostname, blocking=True):
+    if not opt_use_cachefile or opt_no_cache or i_am_root():
+        return None
+    import fcntl
+    lock_dir = tcp_cache_dir + "/.locks"
+    try:
+        if not os.path.exists(lock_dir):
+            os.makedirs(lock_dir)
+        lock = file(lock_dir + "/" + hostname, "a")
+    except (OSError, IOError):
+        return None # not allowed or created by another process meanwhile: fetch without lock
+
+    try:
+        if blocking:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        else:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return lock
+    except IOError:
+        lock.close()
+        if blocking:
+            return None # interrupted: fetch without lock
+        else:
+            return False
+
+def unlock_agent_cache(lock):
+    if lock:
+        lock.close() # releases the lock
+
 # Get data in case of external programm
 def get_agent_info_program(commandline):
     if opt_verbose:
@@ -489,6 +559,134 @@ def get_agent_info_tcp(hostname, ipaddress):
                            (ipaddress, agent_port_of(hostname), e))
 
 
+# Fetch the agent output of many hosts at once. Instead of contacting
+# one agent after the other, all connections are handled in parallel
+# with select(). Each host has its own connect timeout of
+# tcp_connect_timeout seconds. At most max_num_connections connections
+# are open at the same time. The output is written to the cache files
+# and kept in memory, so that get_agent_info() uses it instead of
+# contacting the agent again. Errors are raised by get_agent_info().
+# Hosts not using TCP, having a fresh cache file or being fetched by
+# another process right now are skipped. Clusters must not be passed
+# (within precompiled checks of clusters is_cluster() is always True).
+def prefetch_agent_infos(hostnames, max_cache_age):
+    import select, errno
+
+    todo = []
+    for hostname in hostnames:
+        if not is_tcp_host(hostname) or hostname in g_prefetched_agent_infos \
+           or hostname in g_agent_already_contacted:
+            continue
+
+        cachefile = tcp_cache_dir + "/" + hostname
+        if opt_use_cachefile and not opt_no_cache and os.path.exists(cachefile) \
+           and cachefile_age(cachefile) <= max_cache_age:
+            continue
+
+        try:
+            ipaddress = lookup_ipaddress(hostname)
+        except:
+            continue # error is reported when the host is processed
+
+        if ipaddress and not get_datasource_program(hostname, ipaddress):
+            todo.append((hostname, ipaddress))
+
+    if opt_verbose and todo:
+        sys.stderr.write("Fetching agent data of %d hosts in parallel.\n" % len(todo))
+
+    def fetch_failed(conn, reason):
+        g_prefetched_agent_infos[conn["hostname"]] = \
+            MKAgentError("Cannot get data from TCP port %s:%d: %s" %
+                         (conn["ipaddress"], conn["port"], reason))
+        unlock_agent_cache(conn["lock"])
+
+    def fetch_finished(conn):
+        output = "".join(conn["output"])
+        if len(output) == 0: # may be caused by xinetd not allowing our address
+            g_prefetched_agent_infos[conn["hostname"]] = \
+                MKAgentError("Empty output from agent at TCP port %d" % conn["port"])
+        else:
+            write_cache_file(conn["hostname"], output)
+            g_prefetched_agent_infos[conn["hostname"]] = output
+        unlock_agent_cache(conn["lock"])
+
+    todo.reverse()
+    connections = {} # socket -> connection
+    while todo or connections:
+        # Open new connections. The lock of a host is taken only now,
+        # so that not a lock file of each host is open at the same time.
+        # Hosts locked by another process are skipped.
+        while todo and len(connections) < max_num_connections:
+            hostname, ipaddress = todo.pop()
+            lock = lock_agent_cache(hostname, False)
+            if lock is False:
+                continue
+            conn = { "hostname"  : hostname,
+                     "ipaddress" : ipaddress,
+                     "lock"      : lock,
+                     "port"      : agent_port_of(hostname),
+                     "deadline"  : time.time() + tcp_connect_timeout,
+                     "connected" : False,
+                     "output"    : [] }
+            try:
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                s.setblocking(0)
+                err = s.connect_ex((ipaddress, conn["port"]))
+            except Exception, e:
+                fetch_failed(conn, e)
+                continue
+            if err not in [ 0, errno.EINPROGRESS, errno.EWOULDBLOCK ]:
+                s.close()
+                fetch_failed(conn, os.strerror(err))
+                continue
+            connections[s] = conn
+
+        connecting = [ s for s, c in connections.items() if not c["connected"] ]
+        reading    = [ s for s, c in connections.items() if c["connected"] ]
+        if connecting:
+            timeout = max(0, min([ connections[s]["deadline"] for s in connecting ]) - time.time())
+        else:
+            timeout = None
+
+        try:
+            readable, writable, broken = select.select(reading, connecting, [], timeout)
+        except select.error, e:
+            if e[0] == errno.EINTR:
+                continue
+            raise
+
+        for s in writable:
+            err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                fetch_failed(connections[s], os.strerror(err))
+                s.close()
+                del connections[s]
+            else:
+                connections[s]["connected"] = True
+
+        for s in readable:
+            try:
+                chunk = s.recv(65536)
+            except socket.error, e:
+                fetch_failed(connections[s], e)
+                s.close()
+                del connections[s]
+                continue
+            if chunk:
+                connections[s]["output"].append(chunk)
+            else:
+                s.close()
+                fetch_finished(connections[s])
+                del connections[s]
+
+        now = time.time()
+        for s, conn in connections.items():
+            if not conn["connected"] and now >= conn["deadline"]:
+                fetch_failed(conn, "timed out")
+                s.close()
+                del connections[s]
+
+
 # Gets all information about one host so far cached.
 # Returns None if nothing has been stored so far
 def get_cached_hostinfo(hostname):
@@ -500,10 +698,15 @@ def store_cached_hostinfo(hostname, info):
     global g_infocache
     oldinfo = get_cached_hostinfo(hostname)
     if oldinfo:
-        oldinfo.update(info)
-        g_infocache[hostname] = oldinfo
-    else:
-        g_infocache[hostname] = info
+        if not isinstance(info, dict):
+            return # nothing to add, e.g. empty info after an error
+        # Merge the old sections into the new info, so that sections of
+        # the agent output that have not been parsed yet stay unparsed.
+        # Only the old sections missing in info are fetched.
+        for key in oldinfo.keys():
+            if key not in info:
+                info[key] = oldinfo[key]
+    g_infocache[hostname] = info
 
 # store information about one check type
 def store_cached_checkinfo(hostname, checkname, table):
@@ -514,6 +717,28 @@ def store_cached_checkinfo(hostname, checkname, table):
     else:
         g_infocache[hostname] = { checkname: table }
 
+# Forget all data fetched from hosts so far. A normal Check_MK
+# process checks only one host and never needs this. The check
+# helper calls it before each host check.
+def reset_host_caches():
+    global g_infocache, g_agent_already_contacted
+    global g_single_oid_hostname, g_single_oid_cache
+    global g_broken_snmp_hosts, g_broken_agent_hosts
+    global g_prefetched_agent_infos, g_inline_snmp_cache
+    global g_submission_buffer
+    g_infocache                 = {}
+    g_agent_already_contacted   = {}
+    g_single_oid_hostname       = None
+    g_single_oid_cache          = {}
+    g_broken_snmp_hosts         = set([])
+    g_broken_agent_hosts        = set([])
+    g_prefetched_agent_infos    = {}
+    g_inline_snmp_cache         = {}
+    g_submission_buffer         = [] # left over if the last host check was aborted
+    for session in g_inline_snmp_sessions.values():
+        session["socket"].close()
+    g_inline_snmp_sessions.clear()
+
 # Split agent output in chunks, splits lines by whitespaces
 def parse_info(lines):
     info = {}
@@ -549,6 +774,104 @@ def parse_info(lines):
     return info
 
 
+# Parsing the complete agent output with parse_info() is expensive
+# for large outputs, while a check only needs its own section. This
+# dictionary just scans the output for section headers and splits
+# the lines of a section not before they are accessed. The result
+# is exactly the same as with parse_info().
+g_section_header_regex = re.compile("^[ \t\r\f\v]*<<<(.*)>>>[ \t\r\f\v]*$", re.M)
+
+class AgentSections(dict):
+    def __init__(self, output):
+        dict.__init__(self)
+        self._output = output
+        self._unparsed = {} # section name -> list of (start, end, separator)
+        spans = None
+        for match in g_section_header_regex.finditer(output):
+            if spans != None:
+                spans[-1][1] = match.start()
+            # chunk header has format <<<name:opt1(args):opt2:opt3(args)>>>
+            headerparts = match.group(1).split(":")
+            chunkname = headerparts[0]
+            chunkoptions = {}
+            for o in headerparts[1:]:
+                opt_parts = o.split("(")
+                if len(opt_parts) > 1:
+                    chunkoptions[opt_parts[0]] = opt_parts[1][:-1]
+                else:
+                    chunkoptions[opt_parts[0]] = None
+            try:
+                separator = chr(int(chunkoptions["sep"]))
+            except:
+                separator = None
+            spans = self._unparsed.setdefault(chunkname, [])
+            spans.append([match.end(), len(output), separator])
+            dict.__setitem__(self, chunkname, None)
+
+    def _parse_section(self, chunkname):
+        chunk = []
+        for start, end, separator in self._unparsed.pop(chunkname):
+            for line in self._output[start:end].split("\n"):
+                line = line.strip()
+                if line != '':
+                    chunk.append(line.split(separator))
+        dict.__setitem__(self, chunkname, chunk)
+        if not self._unparsed:
+            self._output = None # not needed anymore
+        return chunk
+
+    def __getitem__(self, chunkname):
+        if chunkname in self._unparsed:
+            return self._parse_section(chunkname)
+        return dict.__getitem__(self, chunkname)
+
+    def __setitem__(self, chunkname, value):
+        if chunkname in self._unparsed:
+            del self._unparsed[chunkname]
+        dict.__setitem__(self, chunkname, value)
+
+    def get(self, chunkname, default=None):
+        if chunkname in self:
+            return self[chunkname]
+        return default
+
+    def values(self):
+        return [ self[chunkname] for chunkname in self.keys() ]
+
+    def items(self):
+        return [ (chunkname, self[chunkname]) for chunkname in self.keys() ]
+
+    def itervalues(self):
+        for chunkname in self.keys():
+            yield self[chunkname]
+
+    def iteritems(self):
+        for chunkname in self.keys():
+            yield chunkname, self[chunkname]
+
+    def pop(self, chunkname, *default):
+        if chunkname in self._unparsed:
+            self._parse_section(chunkname)
+        return dict.pop(self, chunkname, *default)
+
+    def setdefault(self, chunkname, default=None):
+        if chunkname not in self:
+            self[chunkname] = default
+        return self[chunkname]
+
+    def update(self, other):
+        for chunkname, value in other.items():
+            self[chunkname] = value
+
+    # The copy shares the agent output, but parses its sections on its own
+    def copy(self):
+        other = AgentSections("")
+        dict.update(other, self)
+        other._output = self._output
+        other._unparsed = self._unparsed.copy()
+        return other
+
+
 def cachefile_age(filename):
     try:
         return time.time() - os.stat(filename)[8]
@@ -567,22 +890,53 @@ def cachefile_age(filename):
 #   +----------------------------------------------------------------------+
 
 
-# Variable                 time_t    value
-# netctr.eth.tx_collisions 112354335 818
+# Counters are stored in a binary file per host (marshal format with a
+# small header). It contains the counters and the time of the last change
+# of each counter. Counters that have not changed for counters_max_age
+# seconds are removed. Files in the old formats (Python repr() or lines of
+# "name time value") are still read and converted when saving.
+counters_file_magic = "CMKCOUNTERS1\n"
+
 def load_counters(hostname):
-    global g_counters
+    global g_counters, g_counters_loaded, g_counters_updated
     filename = counters_directory + "/" + hostname
+
+    # The check helper keeps the counters in memory. We only
+    # need to read the file if someone else has changed it.
+    if g_counters_cache != None:
+        stamp, counters, updated = g_counters_cache.get(hostname, (None, None, None))
+        if stamp != None and stamp == counters_file_stamp(filename):
+            g_counters, g_counters_updated = counters, updated
+            g_counters_loaded = g_counters.copy()
+            return
+
+    g_counters, g_counters_updated = read_counters_file(filename)
+    g_counters_loaded = g_counters.copy()
+
+def read_counters_file(filename):
     try:
-        g_counters = eval(file(filename).read())
+        content = file(filename).read()
+    except:
+        return {}, {}
+
+    if content.startswith(counters_file_magic):
+        try:
+            return marshal.loads(content[len(counters_file_magic):])
+        except:
+            return {}, {}
+
+    try:
+        return eval(content), {}
     except:
         # Try old syntax
         try:
-            lines = file(filename).readlines()
-            for line in lines:
+            counters = {}
+            for line in content.splitlines():
                 line = line.split()
-                g_counters[' '.join(line[0:-2])] = ( int(line[-2]), int(line[-1]) )
+                counters[' '.join(line[0:-2])] = ( int(line[-2]), int(line[-1]) )
+            return counters, {}
         except:
-            g_counters = {}
+            return {}, {}
 
 def get_counter(countername, this_time, this_val, allow_negative=False):
     global g_counters
@@ -668,14 +1022,51 @@ def save_counters(hostname):
     if not opt_dont_submit and not i_am_root(): # never writer counters as root
         global g_counters
         filename = counters_directory + "/" + hostname
+
+        # Remember when counters have changed and remove those counters
+        # that have not been changed for too long. Nothing needs to be
+        # written if nothing has changed.
+        now = time.time()
+        changed = len(g_counters) != len(g_counters_loaded)
+        for name, entry in g_counters.items():
+            if name not in g_counters_updated or g_counters_loaded.get(name) != entry:
+                g_counters_updated[name] = now
+                changed = True
+            elif g_counters_updated[name] < now - counters_max_age:
+                del g_counters[name]
+                changed = True
+        for name in g_counters_updated.keys():
+            if name not in g_counters:
+                del g_counters_updated[name]
+        if not changed:
+            return
+
+        # Write to a temporary file first. A crash will never leave
+        # a broken counters file behind.
+        tmp_filename = "%s.new%d" % (filename, os.getpid())
         try:
             if not os.path.exists(counters_directory):
                 os.makedirs(counters_directory)
-            file(filename, "w").write("%r\n" % g_counters)
+            f = file(tmp_filename, "w")
+            f.write(counters_file_magic + marshal.dumps((g_counters, g_counters_updated)))
+            f.close()
+            os.rename(tmp_filename, filename)
         except Exception, e:
             raise MKGeneralException("User %s cannot write to %s: %s" % (username(), filename, e))
+        if g_counters_cache != None:
+            g_counters_cache[hostname] = (counters_file_stamp(filename), g_counters, g_counters_updated)
 
-# writelines([ "%s %d %d\n" % (i[0], i[1][0], i[1][1]) for i in g_counters.items() ])
+    elif g_counters_cache != None and hostname in g_counters_cache:
+        del g_counters_cache[hostname] # memory and file differ now
+
+# Modification time and size of a counters file. Used for detecting
+# changes by other processes.
+def counters_file_stamp(filename):
+    try:
+        st = os.stat(filename)
+        return st.st_mtime, st.st_size
+    except:
+        return None
 
 
 #   +----------------------------------------------------------------------+
@@ -692,6 +1083,15 @@ def save_counters(hostname):
 # This is the main check function - the central entry point to all and
 # everything
 def do_check(hostname, ipaddress, only_check_types = None):
+    status, output = do_check_host(hostname, ipaddress, only_check_types)
+    sys.stdout.write(output)
+    sys.exit(status)
+
+# Performs all checks of one host and submits the results. Returns
+# the exit status and the status line of the Check_MK service. This
+# is also used by the check helper, which runs many host checks
+# within one process.
+def do_check_host(hostname, ipaddress, only_check_types = None):
 
     if opt_verbose:
         sys.stderr.write("Check_mk version %s\n" % check_mk_version)
@@ -734,13 +1134,20 @@ def do_check(hostname, ipaddress, only_check_types = None):
             if opt_debug:
                 raise
 
+    try:
+        flush_submission_buffer()
+    except MKGeneralException, e:
+        if opt_debug:
+            raise
+        output = "UNKNOWN - %s, " % e
+        status = 3
+
     if checkresult_file_fd != None:
         close_checkresult_file()
 
     run_time = time.time() - start_time
     output += "execution time %.1f sec|execution_time=%.3f\n" % (run_time, run_time)
-    sys.stdout.write(output)
-    sys.exit(status)
+    return status, output
 
 def check_unimplemented(checkname, params, info):
     return (3, 'UNKNOWN - Check not implemented')
@@ -1017,21 +1424,46 @@ def submit_check_result(host, servicedesc, result, sa):
         print "%-20s %s%s%-56s%s%s" % (servicedesc, tty_bold, color, result[1], tty_normal, p)
 
 
+# Results are collected during the check of a host and sent to
+# Nagios by flush_submission_buffer() when all checks are done.
 def submit_to_nagios(host, service, state, output):
+    if check_submission not in [ "pipe", "file" ]:
+        raise MKGeneralException("Invalid setting %r for check_submission. Must be 'pipe' or 'file'" % check_submission)
+    g_submission_buffer.append((host, service, state, output))
+
+
+def flush_submission_buffer():
+    global g_submission_buffer
+    if not g_submission_buffer:
+        return
+    results = g_submission_buffer
+    g_submission_buffer = []
+    now = time.time()
+
     if check_submission == "pipe":
         open_command_pipe()
         if nagios_command_pipe:
-            nagios_command_pipe.write("[%d] PROCESS_SERVICE_CHECK_RESULT;%s;%s;%d;%s\n" %
-                                   (int(time.time()), host, service, state, output)  )
             # Important: Nagios needs the complete command in one single write() block!
-            # Python buffers and sends chunks of 4096 bytes, if we do not flush.
-            nagios_command_pipe.flush()
-    elif check_submission == "file":
+            # Writes of up to PIPE_BUF bytes are atomic, so we send as many complete
+            # commands at once as fit into that size. We write directly to the file
+            # descriptor, since Python would split the data in its own buffer size.
+            pipe_buf = getattr(select, "PIPE_BUF", 4096)
+            fd = nagios_command_pipe.fileno()
+            chunk = ""
+            for host, service, state, output in results:
+                line = "[%d] PROCESS_SERVICE_CHECK_RESULT;%s;%s;%d;%s\n" % \
+                       (int(now), host, service, state, output)
+                if chunk and len(chunk) + len(line) > pipe_buf:
+                    os.write(fd, chunk)
+                    chunk = ""
+                chunk += line
+            if chunk:
+                os.write(fd, chunk)
+
+    else:
         open_checkresult_file()
         if checkresult_file_fd:
-            now = time.time()
-            os.write(checkresult_file_fd,
-                """host_name=%s
+            text = "".join([ """host_name=%s
 service_description=%s
 check_type=1
 check_options=0
@@ -1042,9 +1474,9 @@ finish_time=%.1f
 return_code=%d
 output=%s
 
-""" % (host, service, now, now, state, output))
-    else:
-        raise MKGeneralException("Invalid setting %r for check_submission. Must be 'pipe' or 'file'" % check_submission)
+""" % (host, service, now, now, state, output) for host, service, state, output in results ])
+            while text:
+                text = text[os.write(checkresult_file_fd, text):]
 
 
 #   +----------------------------------------------------------------------+
@@ -71,6 +71,9 @@ def oid_to_bin(oid):
 
 
 def snmpwalk_on_suboid(hostname, ip, oid):
+    if use_inline_snmp_for(hostname):
+        return inline_snmp_walk(hostname, ip, oid)
+
     portspec = snmp_port_spec(hostname)
     command = snmp_walk_command(hostname) + \
              " -OQ -OU -On -Ot %s%s %s 2>/dev/null" % (ip, portspec, oid)
@@ -221,40 +224,52 @@ def get_snmp_table(hostname, ip, oid_info):
 
         # First compute the complete list of end-oids appearing in the output
         # by looping all results and putting the endoids to a flat list
+        endoid_columns = []
+        seen = set([])
         endoids = []
         for fetchoid, column in columns:
+            endoid_column = []
             for o, value in column:
                 endoid = extract_end_oid(fetchoid, o)
-                if endoid not in endoids:
+                endoid_column.append(endoid)
+                if endoid not in seen:
+                    seen.add(endoid)
                     endoids.append(endoid)
+            endoid_columns.append(endoid_column)
 
         # The list needs to be sorted to prevent problems when the first
         # column has missing values in the middle of the tree. Since we
         # work with strings of numerical components, a simple string sort
-        # is not correct. 1.14 must come after 1.2!
-        endoids.sort(cmp = cmp_oids)
-
-        # Now fill gaps in columns where some endois are missing
+        # is not correct. 1.14 must come after 1.2! Each end-oid is
+        # converted only once into a list of integers.
+        if len(endoids) > 1:
+            sort_keys = dict([ (eo, oid_to_intlist(eo)) for eo in endoids ])
+            endoids.sort(key = sort_keys.get)
+        num_endoids = len(endoids)
+        positions = dict([ (endoid, n) for n, endoid in enumerate(endoids) ])
+
+        # Now fill gaps in columns where some endois are missing. The
+        # position of each value is looked up. Values of complete columns
+        # are taken as they are. Values being out of order in their column
+        # are appended after the last row, just as they always have been.
         new_columns = []
-        for fetchoid, column in columns:
+        for (fetchoid, column), endoid_column in zip(columns, endoid_columns):
+            if len(column) == num_endoids:
+                new_columns.append([ value for o, value in column ])
+                continue
+
             i = 0
             new_column = []
-            # Loop all lines to fill holes in the middle of the list. All
-            # columns check the following lines for the correct endoid. If
-            # an endoid differs empty values are added until the hole is filled
-            for o, value in column:
-                eo = extract_end_oid(fetchoid, o)
-                if len(column) != len(endoids):
-                    while i < len(endoids) and endoids[i] != eo:
-                        new_column.append("") # (beginoid + '.' +endoids[i], "" ) )
-                        i += 1
+            for (o, value), eo in zip(column, endoid_column):
+                pos = positions[eo]
+                if pos < i:
+                    pos = max(i, num_endoids)
+                new_column += [""] * (pos - i)
                 new_column.append(value)
-                i += 1
+                i = pos + 1
 
             # At the end check if trailing OIDs are missing
-            while i < len(endoids):
-                new_column.append("") # (beginoid + '.' +endoids[i], "") )
-                i += 1
+            new_column += [""] * (num_endoids - i)
             new_columns.append(new_column)
         columns = new_columns
 
@@ -319,8 +334,114 @@ def check_snmp_fixed(item, targetvalue, info):
                 return (0, "OK - %s" % (value,))
     return (3, "Missing item %s in SNMP data" % item)
 
+# Stored snmpwalks are compiled into an index file (name of the walk
+# plus ".idx"), which is accessed via mmap(). Lookups are done by binary
+# search without reading the walk into Python objects. The index starts
+# with a header (magic, mtime and size of the walk file, number of
+# entries), followed by one record per entry: offset and length of the
+# OID key, length of the OID as text and length of the raw value. The
+# text of the OID and the value follow the key directly. The entries
+# are sorted by their keys.
+# A key contains each component of the OID as 4 byte big endian integer,
+# so comparing keys bytewise gives the numerical order of the OIDs and
+# all OIDs below some OID have its key as prefix.
+snmpwalk_index_magic  = "CMKWALK1"
+snmpwalk_index_header = "!dQI"
+snmpwalk_index_entry  = "!IIII"
+
+def snmpwalk_oid_key(oid):
+    import struct
+    try:
+        parts = map(int, oid.strip(".").split("."))
+        return struct.pack("!%dI" % len(parts), *parts)
+    except:
+        raise MKGeneralException("Invalid OID %s" % oid)
+
+# Creates the index of a stored walk. Returns its content. Lines
+# with invalid OIDs are skipped.
+def compile_snmpwalk(path):
+    import struct
+    entries = []
+    for line in file(path):
+        parts = line.split(None, 1)
+        if not parts:
+            continue
+        try:
+            key = snmpwalk_oid_key(parts[0])
+        except MKGeneralException:
+            continue
+        if len(parts) > 1:
+            value = parts[1]
+        else:
+            value = ""
+        entries.append((key, "." + parts[0].lstrip("."), value))
+    entries.sort(key = lambda entry: entry[0])
+
+    st = os.stat(path)
+    header = snmpwalk_index_magic + struct.pack(snmpwalk_index_header,
+                                                st.st_mtime, st.st_size, len(entries))
+    offset = len(header) + struct.calcsize(snmpwalk_index_entry) * len(entries)
+    records = []
+    blob = []
+    for key, oid, value in entries:
+        records.append(struct.pack(snmpwalk_index_entry, offset, len(key),
+                                   len(oid), len(value)))
+        blob += [ key, oid, value ]
+        offset += len(key) + len(oid) + len(value)
+    data = header + "".join(records) + "".join(blob)
+
+    # Saving the index is optional. If we cannot write into the
+    # directory of the walks we use the index just from memory.
+    index_path = path + ".idx"
+    try:
+        tmp_path = "%s.new%d" % (index_path, os.getpid())
+        file(tmp_path, "w").write(data)
+        os.rename(tmp_path, index_path)
+    except Exception, e:
+        if opt_debug:
+            sys.stderr.write("Cannot write %s: %s\n" % (index_path, e))
+    return data
+
+# Returns the index of the stored walk of a host as a pair of the
+# mapped (or read) index and the number of entries in it.
 g_walk_cache = {}
+def get_compiled_snmpwalk(hostname):
+    import struct, mmap
+    if hostname in g_walk_cache:
+        return g_walk_cache[hostname]
+
+    path = snmpwalks_dir + "/" + hostname
+    if not os.path.exists(path):
+        raise MKGeneralException("No snmpwalk file %s\n" % path)
+
+    # Use existing index, if it belongs to the current version of the walk
+    data = None
+    header_size = len(snmpwalk_index_magic) + struct.calcsize(snmpwalk_index_header)
+    try:
+        f = file(path + ".idx")
+        data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        f.close()
+        st = os.stat(path)
+        mtime, size, count = struct.unpack(snmpwalk_index_header,
+                                 data[len(snmpwalk_index_magic):header_size])
+        if data[:len(snmpwalk_index_magic)] != snmpwalk_index_magic \
+           or mtime != st.st_mtime or size != st.st_size:
+            data = None
+    except Exception:
+        data = None
+
+    if data == None:
+        if opt_debug:
+            sys.stderr.write("Compiling snmpwalk file %s\n" % path)
+        data = compile_snmpwalk(path)
+        count = struct.unpack(snmpwalk_index_header, data[len(snmpwalk_index_magic):header_size])[2]
+
+    g_walk_cache[hostname] = data, count
+    return data, count
+
+
 def get_stored_snmpwalk(hostname, oid):
+    import struct
     if oid.startswith("."):
         oid = oid[1:]
 
@@ -331,130 +452,467 @@ def get_stored_snmpwalk(hostname, oid):
         oid_prefix = oid
         dot_star = False
 
-    path = snmpwalks_dir + "/" + hostname
-
     if opt_debug:
-        sys.stderr.write("Getting %s from %s\n" % (oid, path))
-    if not os.path.exists(path):
-        raise MKGeneralException("No snmpwalk file %s\n" % path)
+        sys.stderr.write("Getting %s from %s\n" % (oid, snmpwalks_dir + "/" + hostname))
+
+    data, count = get_compiled_snmpwalk(hostname)
+    table_offset = len(snmpwalk_index_magic) + struct.calcsize(snmpwalk_index_header)
+    entry_size = struct.calcsize(snmpwalk_index_entry)
+
+    def entry(index):
+        offset = table_offset + index * entry_size
+        return struct.unpack(snmpwalk_index_entry, data[offset:offset + entry_size])
+
+    # Find the first entry that is not lower than the OID we look for
+    prefix_key = snmpwalk_oid_key(oid_prefix)
+    begin = 0
+    end = count
+    while begin < end:
+        current = (begin + end) / 2
+        key_offset, key_len, oid_len, value_len = entry(current)
+        if data[key_offset:key_offset + key_len] < prefix_key:
+            begin = current + 1
+        else:
+            end = current
 
+    # Now collect all entries for that OID and below
     rowinfo = []
+    unpack = struct.unpack
+    offset = table_offset + begin * entry_size
+    while begin < count:
+        key_offset, key_len, oid_len, value_len = \
+            unpack(snmpwalk_index_entry, data[offset:offset + entry_size])
+        offset += entry_size
+        begin += 1
+        key = data[key_offset:key_offset + key_len]
+        if not key.startswith(prefix_key):
+            break
+        elif dot_star and key == prefix_key: # only look below the OID
+            continue
+        oid_offset = key_offset + key_len
+        value = data[oid_offset + oid_len:oid_offset + oid_len + value_len]
+        if agent_simulator:
+            value = agent_simulator_process(value)
+        rowinfo.append((data[oid_offset:oid_offset + oid_len], strip_snmp_value(value)))
+        if dot_star:
+            break
+    return rowinfo
 
-    use_new = True
-    if use_new:
-        # New implementation: use binary search
-        def to_bin_string(oid):
-            try:
-                return tuple(map(int, oid.strip(".").split(".")))
-            except:
-                raise MKGeneralException("Invalid OID %s" % oid)
-
-        def compare_oids(a, b):
-            aa = to_bin_string(a)
-            bb = to_bin_string(b)
-            if len(aa) <= len(bb) and bb[:len(aa)] == aa:
-                result = 0
-            else:
-                result = cmp(aa, bb)
-            return result
+# Helper function to be used in checks.  It applies a user-specified
+# character encoding in order to tranlate e.g. latin1 to utf8
+def snmp_decode_string(text):
+    encoding = get_snmp_character_encoding(g_hostname)
+    if encoding:
+        return text.decode(encoding).encode("utf-8")
+    else:
+        return text
 
-        if hostname in g_walk_cache:
-            lines = g_walk_cache[hostname]
-        else:
-            lines = file(path).readlines()
-            g_walk_cache[hostname] = lines
-
-        begin = 0
-        end = len(lines)
-        hit = None
-        while end - begin > 0:
-            current = (begin + end) / 2
-            parts = lines[current].split(None, 1)
-            comp = parts[0]
-            hit = compare_oids(oid_prefix, comp)
-            if hit == 0:
-                break
-            elif hit == 1: # we are too low
-                begin = current + 1
-            else:
-                end = current
 
-        if hit != 0:
-            return [] # not found
 
+# Inline SNMP: Instead of calling snmpwalk once for each column of each SNMP check,
+# Check_MK can talk SNMP itself if use_inline_snmp is set to True. All
+# columns needed by all SNMP checks of a host are fetched at once with
+# GETBULK requests (or GETNEXT requests with several variables for
+# hosts that are not bulkwalk hosts) over one UDP socket per host. The
+# result is kept in g_inline_snmp_cache until the host has been
+# checked. SNMP v3 hosts are still handled by the snmp commands.
 
-        def collect_until(index, direction):
-            rows = []
-            # Handle case, where we run after the end of the lines list
-            if index >= len(lines):
-                if direction > 0:
-                    return []
-                else:
-                    index -= 1
-            while True:
-                line = lines[index]
-                parts = line.split(None, 1)
-                o = parts[0]
-                if o.startswith('.'):
-                    o = o[1:]
-                if o == oid or o.startswith(oid_prefix + "."):
-                    if len(parts) > 1:
-                        value = parts[1]
-                        if agent_simulator:
-                            value = agent_simulator_process(value)
-                    else:
-                        value = ""
-                    # Fix for missing starting oids
-                    rows.append(('.'+o, strip_snmp_value(value)))
-                    index += direction
-                    if index < 0 or index >= len(lines):
-                        break
-                else:
-                    break
-            return rows
+SNMP_GET                 = 0xa0
+SNMP_GETNEXT             = 0xa1
+SNMP_RESPONSE            = 0xa2
+SNMP_GETBULK             = 0xa5
 
+SNMP_ERR_TOOBIG          = 1
+SNMP_ERR_NOSUCHNAME      = 2
 
-        rowinfo = collect_until(current, -1)
-        rowinfo.reverse()
-        rowinfo += collect_until(current + 1, 1)
-        # import pprint ; pprint.pprint(rowinfo)
+SNMP_NO_SUCH_OBJECT      = 0x80
+SNMP_NO_SUCH_INSTANCE    = 0x81
+SNMP_END_OF_MIB_VIEW     = 0x82
 
-        if dot_star:
-            return [ rowinfo[0] ]
-        else:
-            return rowinfo
+inline_snmp_max_columns  = 10 # number of columns walked with one request
 
+def use_inline_snmp_for(hostname):
+    return use_inline_snmp and type(snmp_credentials_of(hostname)) == str
 
+def ber_encode_length(length):
+    if length < 0x80:
+        return chr(length)
+    octets = ""
+    while length:
+        octets = chr(length & 0xff) + octets
+        length >>= 8
+    return chr(0x80 | len(octets)) + octets
 
-    # Old implementation
-    hot = False
-    for line in file(path):
-        parts = line.split(None, 1)
-        o = parts[0]
-        if o.startswith('.'):
-            o = o[1:]
-        if o == oid or o.startswith(oid_prefix + "."):
-            hot = True
-            if len(parts) > 1:
-                value = parts[1]
-                if agent_simulator:
-                    value = agent_simulator_process(value)
+def ber_encode(tag, data):
+    return chr(tag) + ber_encode_length(len(data)) + data
+
+def ber_encode_integer(value):
+    octets = ""
+    while True:
+        octets = chr(value & 0xff) + octets
+        value >>= 8
+        if (value == 0 and not ord(octets[0]) & 0x80) or \
+           (value == -1 and ord(octets[0]) & 0x80):
+            break
+    return ber_encode(0x02, octets)
+
+def ber_encode_oid(oid):
+    parts = map(int, oid.strip(".").split("."))
+    subids = [ parts[0] * 40 + parts[1] ] + parts[2:]
+    octets = ""
+    for subid in subids:
+        encoded = chr(subid & 0x7f)
+        subid >>= 7
+        while subid:
+            encoded = chr(0x80 | (subid & 0x7f)) + encoded
+            subid >>= 7
+        octets += encoded
+    return ber_encode(0x06, octets)
+
+# Returns tag, contents and offset of the next element
+def ber_decode(data, offset):
+    tag = ord(data[offset])
+    length = ord(data[offset + 1])
+    offset += 2
+    if length & 0x80:
+        num_octets = length & 0x7f
+        length = 0
+        for c in data[offset:offset + num_octets]:
+            length = (length << 8) | ord(c)
+        offset += num_octets
+    if offset + length > len(data):
+        raise MKSNMPError("Truncated SNMP packet")
+    return tag, data[offset:offset + length], offset + length
+
+def ber_decode_sequence(data):
+    elements = []
+    offset = 0
+    while offset < len(data):
+        tag, contents, offset = ber_decode(data, offset)
+        elements.append((tag, contents))
+    return elements
+
+def ber_decode_unsigned(octets):
+    value = 0
+    for c in octets:
+        value = (value << 8) | ord(c)
+    return value
+
+def ber_decode_integer(octets):
+    value = ber_decode_unsigned(octets)
+    if octets and ord(octets[0]) & 0x80:
+        value -= 1 << (8 * len(octets))
+    return value
+
+def ber_decode_oid(octets):
+    subids = []
+    subid = 0
+    for c in octets:
+        subid = (subid << 7) | (ord(c) & 0x7f)
+        if not ord(c) & 0x80:
+            subids.append(subid)
+            subid = 0
+    if not subids:
+        return ""
+    first = subids[0]
+    if first >= 80:
+        parts = [ 2, first - 80 ]
+    else:
+        parts = [ first / 40, first % 40 ]
+    return "." + ".".join(map(str, parts + subids[1:]))
+
+# Convert an SNMP value into the text printed by snmpwalk -OQ -OU -On -Ot
+def inline_snmp_display_value(tag, octets):
+    if tag == 0x02: # INTEGER
+        return str(ber_decode_integer(octets))
+    elif tag == 0x04: # OCTET STRING
+        for c in octets:
+            if not (' ' <= c <= '~' or c in " \t\n\r\v\f"):
+                return '"%s "' % " ".join([ "%02X" % ord(c) for c in octets ])
+        return '"%s"' % octets.replace('\\', '\\\\').replace('"', '\\"')
+    elif tag == 0x05: # NULL
+        return "NULL"
+    elif tag == 0x06: # OBJECT IDENTIFIER
+        return ber_decode_oid(octets)
+    elif tag == 0x40: # IpAddress
+        return ".".join([ str(ord(c)) for c in octets ])
+    elif tag in [ 0x41, 0x42, 0x43, 0x46, 0x47 ]: # Counter32, Gauge32, TimeTicks, Counter64, UInteger32
+        return str(ber_decode_unsigned(octets))
+    else:
+        return '"%s "' % " ".join([ "%02X" % ord(c) for c in octets ])
+
+# Convert an SNMP value into the same string that we would get by
+# parsing the output of snmpwalk in snmpwalk_on_suboid()
+def inline_snmp_value(tag, octets):
+    text = inline_snmp_display_value(tag, octets)
+    return strip_snmp_value(" ".join([ l.strip() for l in text.split("\n") ]))
+
+
+def inline_snmp_session(hostname, ip):
+    session = g_inline_snmp_sessions.get(hostname)
+    if session and session["ip"] == ip:
+        return session
+
+    port = 161
+    portspec = snmp_port_spec(hostname)
+    if portspec:
+        port = int(portspec[1:])
+
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.connect((ip, port))
+
+    timing = snmp_timing_of(hostname)
+    if is_snmpv2c_host(hostname):
+        version = 1
+    else:
+        version = 0
+    session = {
+        "ip"              : ip,
+        "socket"          : s,
+        "version"         : version,
+        "community"       : snmp_credentials_of(hostname),
+        "bulk"            : is_bulkwalk_host(hostname),
+        "max_repetitions" : 10,
+        "timeout"         : timing.get("timeout", 1),
+        "retries"         : timing.get("retries", 5),
+        "request_id"      : os.getpid() & 0xffff,
+    }
+    g_inline_snmp_sessions[hostname] = session
+    return session
+
+
+# Send one request and wait for the response. Returns the error status,
+# the error index and the list of variable bindings (oid, tag, value).
+def inline_snmp_request(session, pdu_type, oids, non_repeaters = 0, max_repetitions = 0):
+    import select
+    session["request_id"] = (session["request_id"] + 1) & 0x7fffffff
+    request_id = session["request_id"]
+    varbinds = "".join([ ber_encode(0x30, ber_encode_oid(oid) + "\x05\x00") for oid in oids ])
+    pdu = ber_encode(pdu_type, ber_encode_integer(request_id)
+                             + ber_encode_integer(non_repeaters)
+                             + ber_encode_integer(max_repetitions)
+                             + ber_encode(0x30, varbinds))
+    message = ber_encode(0x30, ber_encode_integer(session["version"])
+                             + ber_encode(0x04, session["community"]) + pdu)
+
+    s = session["socket"]
+    try:
+        for attempt in range(session["retries"] + 1):
+            s.send(message)
+            deadline = time.time() + session["timeout"]
+            while True:
+                timeout = deadline - time.time()
+                if timeout <= 0 or not select.select([s], [], [], timeout)[0]:
+                    break # retry
+                response = parse_snmp_response(s.recv(65535))
+                if response and response[0] == request_id:
+                    return response[1:]
+    except socket.error, e:
+        raise MKSNMPError("SNMP Error on %s: %s" % (session["ip"], e))
+    except IndexError:
+        raise MKSNMPError("SNMP Error on %s: Invalid response" % session["ip"])
+
+    if opt_verbose:
+        sys.stderr.write(tty_red + tty_bold + "ERROR: " + tty_normal + "SNMP error\n")
+    raise MKSNMPError("SNMP Error on %s" % session["ip"])
+
+
+# Returns request id, error status, error index and variable bindings
+# or None, if the packet is no response.
+def parse_snmp_response(packet):
+    tag, message, offset = ber_decode(packet, 0)
+    elements = ber_decode_sequence(message)
+    pdu_tag, pdu = elements[2]
+    if pdu_tag != SNMP_RESPONSE:
+        return None
+    pdu_elements = ber_decode_sequence(pdu)
+    varbinds = []
+    for tag, varbind in ber_decode_sequence(pdu_elements[3][1]):
+        (oid_tag, oid), (value_tag, value) = ber_decode_sequence(varbind)
+        varbinds.append((ber_decode_oid(oid), value_tag, value))
+    return ber_decode_integer(pdu_elements[0][1]), \
+           ber_decode_integer(pdu_elements[1][1]), \
+           ber_decode_integer(pdu_elements[2][1]), \
+           varbinds
+
+
+# Walk several columns at once. Returns a dictionary from the column
+# OID to the list of pairs of OID and value - just like
+# snmpwalk_on_suboid() does for one column.
+def inline_snmp_walk_columns(hostname, ip, columns):
+    session = inline_snmp_session(hostname, ip)
+    rows = dict([ (column, []) for column in columns ])
+
+    todo = list(columns)
+    while todo:
+        active = [ (column, column) for column in todo[:inline_snmp_max_columns] ]
+        todo = todo[inline_snmp_max_columns:]
+
+        while active:
+            oids = [ last for column, last in active ]
+            if session["bulk"]:
+                status, index, varbinds = inline_snmp_request(session, SNMP_GETBULK, oids,
+                                                              0, session["max_repetitions"])
+                if status == SNMP_ERR_TOOBIG and session["max_repetitions"] > 1:
+                    session["max_repetitions"] /= 2
+                    continue
             else:
-                value = ""
-            rowinfo.append((o, strip_snmp_value(value))) # return pair of OID and value
-            if dot_star:
+                status, index, varbinds = inline_snmp_request(session, SNMP_GETNEXT, oids)
+                # SNMP v1 agents tell us this way that the end of the MIB is reached
+                if status == SNMP_ERR_NOSUCHNAME and 0 < index <= len(active):
+                    del active[index - 1]
+                    continue
+
+            if status:
+                raise MKSNMPError("SNMP Error on %s: error status %d" % (ip, status))
+            if not varbinds:
                 break
-        elif hot: # end of interesting part, no point in further search
+
+            # Responses to GETBULK contain the variables row by row
+            still_active = []
+            for nr, (column, last) in enumerate(active):
+                finished = False
+                for oid, tag, value in varbinds[nr::len(active)]:
+                    if tag == SNMP_END_OF_MIB_VIEW or not oid.startswith(column + ".") \
+                        or oid == last:
+                        finished = True
+                        break
+                    elif tag not in [ SNMP_NO_SUCH_OBJECT, SNMP_NO_SUCH_INSTANCE ]:
+                        rows[column].append((oid, inline_snmp_value(tag, value)))
+                    last = oid
+                if not finished:
+                    still_active.append((column, last))
+            active = still_active
+
+    # Like snmpwalk we try a GET on those OIDs where the walk did not
+    # find anything. They might be single variables.
+    missing = [ column for column in columns if not rows[column] ]
+    while missing:
+        status, index, varbinds = inline_snmp_request(session, SNMP_GET, missing)
+        if status == SNMP_ERR_NOSUCHNAME and 0 < index <= len(missing):
+            del missing[index - 1]
+            continue
+        elif status:
             break
-    # import pprint ; pprint.pprint(rowinfo)
-    return rowinfo
+        for oid, tag, value in varbinds:
+            if oid in rows and tag not in [ SNMP_NO_SUCH_OBJECT,
+                             SNMP_NO_SUCH_INSTANCE, SNMP_END_OF_MIB_VIEW ]:
+                rows[oid].append((oid, inline_snmp_value(tag, value)))
+        break
+
+    return rows
+
+
+def inline_snmp_walk(hostname, ip, oid):
+    cache = g_inline_snmp_cache.setdefault(hostname, {})
+    if oid not in cache:
+        if opt_debug:
+            sys.stderr.write('   Inline SNMP walk of %s on %s\n' % (oid, ip))
+        cache.update(inline_snmp_walk_columns(hostname, ip, [oid]))
+    return cache[oid]
+
+
+# Fetch a single OID (or the next one, if getnext is True) for
+# get_single_oid(). Returns the value as printed by snmpget
+# without quotes or None if the OID does not exist.
+def inline_snmp_get(hostname, ip, oid, getnext = False):
+    session = inline_snmp_session(hostname, ip)
+    if getnext:
+        pdu_type = SNMP_GETNEXT
+    else:
+        pdu_type = SNMP_GET
+    status, index, varbinds = inline_snmp_request(session, pdu_type, [oid])
+    if status or not varbinds:
+        return None
+
+    o, tag, value = varbinds[0]
+    if tag in [ SNMP_NO_SUCH_OBJECT, SNMP_NO_SUCH_INSTANCE, SNMP_END_OF_MIB_VIEW ] \
+        or (getnext and not o.startswith(oid + ".")):
+        return None
+
+    value = inline_snmp_display_value(tag, value).split("\n")[0].strip()
+    if value.startswith('"') and value.endswith('"'):
+        value = value[1:-1]
+    return value
+
+
+# Get several OIDs with one request. Returns a dictionary from the
+# OID to the value (like inline_snmp_get() returns it). OIDs that
+# the agent does not know are mapped to None. If an SNMP v1 agent
+# rejects the request because of one unknown OID, that OID is
+# dropped and the request is repeated with the others.
+def inline_snmp_get_multiple(hostname, ip, oids):
+    session = inline_snmp_session(hostname, ip)
+    values = {}
+    todo = list(oids)
+    while todo:
+        status, index, varbinds = inline_snmp_request(session, SNMP_GET, todo)
+        if status == SNMP_ERR_NOSUCHNAME and 0 < index <= len(todo):
+            values[todo[index - 1]] = None
+            del todo[index - 1]
+            continue
+        elif status or len(varbinds) != len(todo):
+            break # leave the rest to inline_snmp_get()
+
+        for oid, (o, tag, value) in zip(todo, varbinds):
+            if tag in [ SNMP_NO_SUCH_OBJECT, SNMP_NO_SUCH_INSTANCE, SNMP_END_OF_MIB_VIEW ]:
+                values[oid] = None
+            else:
+                value = inline_snmp_display_value(tag, value).split("\n")[0].strip()
+                if value.startswith('"') and value.endswith('"'):
+                    value = value[1:-1]
+                values[oid] = value
+        break
+    return values
+
+
+# Returns the list of OIDs get_snmp_table() walks for one entry in snmp_info
+def snmp_info_fetchoids(oid_info):
+    if type(oid_info) == list:
+        fetchoids = []
+        for entry in oid_info:
+            fetchoids += snmp_info_fetchoids(entry)
+        return fetchoids
 
-# Helper function to be used in checks.  It applies a user-specified
-# character encoding in order to tranlate e.g. latin1 to utf8
-def snmp_decode_string(text):
-    encoding = get_snmp_character_encoding(g_hostname)
-    if encoding:
-        return text.decode(encoding).encode("utf-8")
+    if len(oid_info) == 2:
+        oid, targetcolumns = oid_info
+        suboids = [None]
     else:
-        return text
+        oid, suboids, targetcolumns = oid_info
 
+    fetchoids = []
+    for suboid in suboids:
+        for column in targetcolumns:
+            if column in [ OID_END, OID_STRING, OID_BIN ]:
+                continue
+            fetchoid = oid
+            if suboid:
+                fetchoid += "." + str(suboid)
+            if column != "":
+                fetchoid += "." + str(column)
+            fetchoids.append(fetchoid)
+    return fetchoids
+
+
+# Fetch the columns of all SNMP checks of a host at once. check_type
+# is the check that is about to be processed. It is also fetched if
+# it is not in the check table of the host (e.g. during inventory).
+def inline_snmp_prefetch(hostname, ip, check_type):
+    if hostname in g_inline_snmp_cache or opt_use_snmp_walk or is_usewalk_host(hostname):
+        return
+
+    check_types = set([ check_type ])
+    for entry in get_sorted_check_table(hostname):
+        check_types.add(entry[0].split(".")[0])
+
+    fetchoids = []
+    for ct in check_types:
+        if ct in snmp_info:
+            for fetchoid in snmp_info_fetchoids(snmp_info[ct]):
+                if fetchoid not in fetchoids:
+                    fetchoids.append(fetchoid)
+
+    if opt_verbose:
+        sys.stderr.write("Fetching %d SNMP columns of %s with inline SNMP.\n" %
+                         (len(fetchoids), hostname))
+    g_inline_snmp_cache[hostname] = inline_snmp_walk_columns(hostname, ip, fetchoids)
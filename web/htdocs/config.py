@@ -503,6 +503,14 @@ def load_default_values(into):
     # Show livestatus errors in multi site setup if some sites are
     # not reachable.
     into["show_livestatus_errors"] = True
+
+    # Overall time in seconds all sites have for answering a livestatus
+    # query in a multi site setup. Slower sites are regarded as dead.
+    into["livestatus_query_timeout"] = None
+
+    # Share the results of frequent livestatus queries (snapins, dashboards)
+    # between all requests for a few seconds
+    into["livestatus_query_cache"] = False
     
     # Set this to a list in order to globally control which views are
     # being displayed in the sidebar snapin "Views"
@@ -522,7 +522,11 @@ def render_statistics(pie_id, what, table, filter):
         query += entry[3]
     query += filter
 
-    result = html.live.query_summed_stats(query)
+    html.live.set_cache_ttl(5)
+    try:
+        result = html.live.query_summed_stats(query)
+    finally:
+        html.live.set_cache_ttl()
     pies = zip(table, result)
     total = sum([x[1] for x in pies])
 
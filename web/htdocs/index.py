@@ -35,7 +35,7 @@ from mod_python import apache, util, Cookie
 import sys, os, pprint
 from lib import *
 import livestatus
-import defaults, config, htmllib, login
+import defaults, config, htmllib, login, livecache
 
 # Load page handlers
 pagehandlers = {}
@@ -120,12 +120,20 @@ def connect_to_livestatus(html):
                 enabled_sites[sitename] = site
 
         html.live = livestatus.MultiSiteConnection(enabled_sites, disabled_sites)
+        html.live.set_query_timeout(config.livestatus_query_timeout)
+        if config.livestatus_query_cache:
+            html.live.set_cache(livecache.QueryCache())
 
         # Fetch status of sites by querying the version of Nagios and livestatus
         html.live.set_prepend_site(True)
-        for sitename, v1, v2, ps, num_hosts, num_services in html.live.query(
+        html.live.set_cache_ttl(5)
+        try:
+            sites = html.live.query(
               "GET status\n"
-              "Columns: livestatus_version program_version program_start num_hosts num_services"):
+              "Columns: livestatus_version program_version program_start num_hosts num_services")
+        finally:
+            html.live.set_cache_ttl()
+        for sitename, v1, v2, ps, num_hosts, num_services in sites:
             html.site_status[sitename].update({
                 "state" : "online",
                 "livestatus_version": v1,
@@ -150,8 +158,14 @@ def connect_to_livestatus(html):
     else:
         html.live = livestatus.SingleSiteConnection("unix:" + defaults.livestatus_unix_socket)
         html.live.set_timeout(10) # default timeout is 10 seconds
+        if config.livestatus_query_cache:
+            html.live.set_cache(livecache.QueryCache())
         html.site_status = { '': { "state" : "dead", "site" : config.site('') } }
-        v1, v2, ps = html.live.query_row("GET status\nColumns: livestatus_version program_version program_start")
+        html.live.set_cache_ttl(5)
+        try:
+            v1, v2, ps = html.live.query_row("GET status\nColumns: livestatus_version program_version program_start")
+        finally:
+            html.live.set_cache_ttl()
         html.site_status[''].update({ "state" : "online", "livestatus_version": v1, "program_version" : v2, "program_start" : ps })
 
     # If Multisite is retricted to data user is a nagios contact for,
@@ -404,6 +418,7 @@ def handler(req, profiling = True):
             html.footer()
         response_code = apache.OK
 
+    livecache.save_statistics()
     release_all_locks()
     html.live = None # disconnects from livestatus
     return response_code
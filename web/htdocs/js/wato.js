@@ -248,6 +248,10 @@ var progress_term_url   = '';
 var progress_fin_txt   = '';
 // Is set to true while one request is waiting for a response
 var progress_running = false;
+// Number of items to be handled by one request
+var progress_bulk_size = 1;
+// Number of items handled by the currently running request
+var progress_current_num = 0;
 // Is set to true to put the processing to sleep
 var progress_paused  = false;
 // Is set to true when the user hit aborted/finished
@@ -255,7 +259,7 @@ var progress_ended   = false;
 
 function progress_handle_response(data, code) {
     var mode = data[0];
-    var item = data[1];
+    var items = data[1];
 
     var header = null;
     try {
@@ -271,8 +275,15 @@ function progress_handle_response(data, code) {
     body.splice(0,1);
     body = body.join('');
 
+    // A request for several items is answered with a list of
+    // headers - one for each item
+    var headers = [ header ];
+    if (header !== null && header.length > 0 && typeof(header[0]) === 'object')
+        headers = header;
+
     // Process statistics
-    update_progress_stats(header);
+    for (var i = 0; i < headers.length; i++)
+        update_progress_stats(headers[i]);
 
     // Process the bar
     update_progress_bar(header);
@@ -281,14 +292,16 @@ function progress_handle_response(data, code) {
     if (typeof(body) !== 'undefined' && body != '')
         progress_attach_log(body);
 
-    if (header[0] === 'pause')
-        progress_pause();
-    else if (header[0] == 'failed')
-        failed_items.push(item);
-    else if (header[0] === 'abort')
-        return;
+    for (var i = 0; i < headers.length; i++) {
+        if (headers[i][0] === 'pause')
+            progress_pause();
+        else if (headers[i][0] == 'failed')
+            failed_items.push(items[i]);
+        else if (headers[i][0] === 'abort')
+            return;
+    }
 
-    progress_items.shift();
+    progress_items.splice(0, items.length);
     progress_running = false;
 }
 
@@ -373,7 +386,7 @@ function update_progress_stats(header) {
 }
 
 function update_progress_bar(header) {
-    var num_done  = progress_total_num - progress_items.length + 1;
+    var num_done  = progress_total_num - progress_items.length + progress_current_num;
     var perc_done = num_done / progress_total_num * 100;
 
     var bar      = document.getElementById('progress_bar');
@@ -404,9 +417,11 @@ function progress_clean_log() {
     log = null;
 }
 
-function progress_scheduler(mode, url_prefix, timeout, items, end_url, success_stats, term_url, finished_txt) {
+function progress_scheduler(mode, url_prefix, timeout, items, end_url, success_stats, term_url, finished_txt, bulk_size) {
     // Initialize
     if (progress_items === null) {
+        if (bulk_size)
+            progress_bulk_size = bulk_size;
         progress_items         = items;
         failed_items           = Array();
         progress_total_num     = items.length;
@@ -428,10 +443,16 @@ function progress_scheduler(mode, url_prefix, timeout, items, end_url, success_s
         if (progress_items.length > 0) {
             // Progressing
             progress_running = true;
+            // Several items are sent separated by newlines
+            var items = progress_items.slice(0, progress_bulk_size);
+            progress_current_num = items.length;
             // Remove leading pipe signs (when having no folder set)
-            update_progress_title(progress_items[0].replace(/^\|*/g, ''));
+            var titles = [];
+            for (var i = 0; i < items.length; i++)
+                titles.push(items[i].replace(/^\|*/g, ''));
+            update_progress_title(titles.join(', '));
             get_url(url_prefix + '&_transid=-1&_item=' +
-                   escape(progress_items[0]), progress_handle_response, [ mode, progress_items[0] ]);
+                   escape(items.join('\n')), progress_handle_response, [ mode, items ]);
         } else {
             progress_finished();
             return;
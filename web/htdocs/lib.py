@@ -247,3 +247,78 @@ def release_all_locks():
     g_locked_paths = []
 
 
+
+# Data row of a view. Instead of a dictionary per row, the values are kept
+# in the list received from livestatus and the positions of the columns in
+# a dictionary shared by all rows of a query. Painters and sorters access
+# the row like a dictionary. Keys that are not columns of the query (like
+# "JOIN") are stored in an extra dictionary of the row.
+class Row(object):
+    __slots__ = [ "_index", "_values", "_extra" ]
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+        self._extra = None
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._index[key]]
+        except KeyError:
+            if self._extra == None:
+                raise
+            return self._extra[key]
+
+    def get(self, key, deflt = None):
+        try:
+            return self._values[self._index[key]]
+        except KeyError:
+            if self._extra == None:
+                return deflt
+            return self._extra.get(key, deflt)
+
+    def __setitem__(self, key, value):
+        i = self._index.get(key)
+        if i != None:
+            self._values[i] = value
+        else:
+            if self._extra == None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __contains__(self, key):
+        return key in self._index or (self._extra != None and key in self._extra)
+
+    def has_key(self, key):
+        return key in self
+
+    def keys(self):
+        keys = self._index.keys()
+        if self._extra != None:
+            keys += self._extra.keys()
+        return keys
+
+    def values(self):
+        return [ self[key] for key in self.keys() ]
+
+    def items(self):
+        return [ (key, self[key]) for key in self.keys() ]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def copy(self):
+        row = Row(self._index, self._values[:])
+        if self._extra != None:
+            row._extra = self._extra.copy()
+        return row
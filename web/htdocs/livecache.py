@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2012             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# ails.  You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+
+# Shared cache for the results of livestatus queries. Snapins, dashboards
+# and the site status send the same queries with each page and with each
+# refresh of every user. If livestatus_query_cache is enabled, queries
+# that have been marked with set_cache_ttl() are answered from files
+# below var/web, which all processes of the web server share.
+
+import os, time, md5, marshal
+import defaults, config
+from lib import *
+
+cache_dir       = defaults.var_dir + "/web/livestatus_cache"
+statistics_file = cache_dir + "/statistics.mk"
+max_entry_age   = 60 # Entries of this age are removed
+
+# Hits and misses of the current request, see save_statistics()
+g_hits = 0
+g_misses = 0
+g_last_cleanup = 0
+
+class QueryCache:
+    def __init__(self):
+        make_nagios_directory(cache_dir)
+
+    def entry_path(self, sitename, query, auth_header):
+        # Differences in white space do not make a query different
+        lines = [ l.strip() for l in query.split("\n") ]
+        query = "\n".join([ l for l in lines if l ])
+        return cache_dir + "/" + md5.md5(repr((sitename, query, auth_header))).hexdigest()
+
+    def get(self, sitename, query, auth_header, ttl):
+        global g_hits, g_misses
+        path = self.entry_path(sitename, query, auth_header)
+        try:
+            if time.time() - os.stat(path).st_mtime < ttl:
+                rows = marshal.loads(file(path).read())
+                g_hits += 1
+                return rows
+        except (OSError, IOError, EOFError, ValueError, TypeError):
+            pass
+        g_misses += 1
+        return None
+
+    def put(self, sitename, query, auth_header, rows):
+        path = self.entry_path(sitename, query, auth_header)
+        # Other processes might read the entry at the same time
+        tmp_path = path + ".%d" % os.getpid()
+        try:
+            f = create_user_file(tmp_path, "w")
+            f.write(marshal.dumps(rows))
+            f.close()
+            os.rename(tmp_path, path)
+        except (OSError, IOError, ValueError):
+            pass # the cache is no reason for failing a page
+        remove_old_entries()
+
+def remove_old_entries():
+    global g_last_cleanup
+    now = time.time()
+    if now - g_last_cleanup < max_entry_age:
+        return
+    g_last_cleanup = now
+    for fn in os.listdir(cache_dir):
+        path = cache_dir + "/" + fn
+        if path == statistics_file:
+            continue
+        try:
+            if now - os.stat(path).st_mtime > max_entry_age:
+                os.remove(path)
+        except OSError:
+            pass
+
+def load_statistics():
+    try:
+        return eval(file(statistics_file).read())
+    except:
+        return {}
+
+# Adds the hits and misses of the current request to the statistics
+# of all processes. Called at the end of each request.
+def save_statistics():
+    global g_hits, g_misses
+    if not g_hits and not g_misses:
+        return
+    try:
+        if not os.path.exists(statistics_file):
+            write_settings_file(statistics_file, { "since" : time.time() })
+        aquire_lock(statistics_file)
+        stats = load_statistics()
+        stats["hits"] = stats.get("hits", 0) + g_hits
+        stats["misses"] = stats.get("misses", 0) + g_misses
+        write_settings_file(statistics_file, stats)
+    except (OSError, IOError):
+        pass
+    g_hits = 0
+    g_misses = 0
+
+def page_statistics():
+    html.header(_("Livestatus query cache"))
+    if not config.livestatus_query_cache:
+        html.write("<p>%s</p>" % _("The cache is disabled. You can enable it with the global "
+                                   "setting <i>Cache for Livestatus queries</i>."))
+
+    stats = load_statistics()
+    hits = stats.get("hits", 0)
+    misses = stats.get("misses", 0)
+    num_entries = 0
+    size = 0
+    if os.path.exists(cache_dir):
+        for fn in os.listdir(cache_dir):
+            path = cache_dir + "/" + fn
+            if path != statistics_file:
+                try:
+                    size += os.stat(path).st_size
+                    num_entries += 1
+                except OSError:
+                    pass
+
+    html.write("<table class=data>\n")
+    for title, value in [
+        (_("Counting since"), "since" in stats and time.strftime("%Y-%m-%d %H:%M:%S",
+                                  time.localtime(stats["since"])) or "-"),
+        (_("Hits"),           "%d" % hits),
+        (_("Misses"),         "%d" % misses),
+        (_("Hit ratio"),      hits + misses and "%.1f%%" % (100.0 * hits / (hits + misses)) or "-"),
+        (_("Cached results"), "%d" % num_entries),
+        (_("Size"),           "%.1f KB" % (size / 1024.0)),
+        ]:
+        html.write("<tr class=data><td class=left>%s</td><td class=number>%s</td></tr>\n" % (title, value))
+    html.write("</table>\n")
+    html.footer()
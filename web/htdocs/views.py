@@ -224,6 +224,10 @@ class Filter:
     def heading_info(self, infoname):
         return None
 
+# Does the filter implement filter_table()?
+def filters_table(f):
+    return f.filter_table.im_func is not Filter.filter_table.im_func
+
 
 # Load all views - users or builtins
 def load_views():
@@ -1237,6 +1241,15 @@ def show_view(view, show_heading = False, show_buttons = True,
     painter_options = list(set(painter_options))
     painter_options.sort()
 
+    # If only the number of rows is needed, let livestatus count them. This
+    # is not possible if rows are filtered or merged after the query.
+    if only_count and type(tablename) != type(lambda x:None) \
+       and not datasource.get("merge_by") and not datasource.get("add_columns") \
+       and not [ f for f in all_active_filters if filters_table(f) ]:
+        for varname, value in view["hard_filtervars"]:
+            html.del_var(varname)
+        return count_data(datasource, query, only_sites)
+
     # Fetch data. Some views show data only after pressing [Search]
     if (only_count or (not view["mustsearch"]) or html.var("filled_in") in ["filter", 'actions', 'confirm']):
         # names for additional columns (through Stats: headers)
@@ -1262,7 +1275,6 @@ def show_view(view, show_heading = False, show_buttons = True,
     for filter in all_active_filters:
         rows = filter.filter_table(rows)
 
-    # TODO: Use livestatus Stats: instead of fetching rows!
     if only_count:
         for varname, value in view["hard_filtervars"]:
             html.del_var(varname)
@@ -1771,6 +1783,20 @@ def ajax_count_button():
     config.save_user_file("buttoncounts", counts)
 
 
+# Returns the number of rows query_data() would fetch (without limit). Only
+# the counts per site are transferred by livestatus.
+def count_data(datasource, add_headers, only_sites = []):
+    add_headers += datasource.get("add_headers", "")
+    column = [ c for c in datasource["idkeys"] if c != "site" ][0]
+    # The two filters together match each row
+    query = "GET %s\n%sStats: %s = \nStats: %s != \nStatsOr: 2\n" % \
+            (datasource["table"], add_headers, column, column)
+    if only_sites:
+        html.live.set_only_sites(only_sites)
+    counts = html.live.query_column(query)
+    html.live.set_only_sites(None)
+    return sum(counts)
+
 # Retrieve data via livestatus, convert into list of dicts,
 # prepare row-function needed for painters
 # datasource: the datasource object as defined in plugins/views/datasources.py
@@ -1818,18 +1844,27 @@ def query_data(datasource, columns, add_columns, add_headers, only_sites = [], l
 
     if only_sites:
         html.live.set_only_sites(only_sites)
-    data = html.live.query(query)
+    if merge_column:
+        data = merge_data(html.live.query(query), columns)
+    else:
+        data = html.live.query_iter(query) # rows are converted while being received
+
+    # convert lists-rows into Row objects, which can be used like
+    # dictionaries. All rows share one column index.
+    columns = ["site"] + columns + add_columns
+    index = dict([ (c, i) for i, c in enumerate(columns) ])
+    rows = [ Row(index, row) for row in data ]
+
     html.live.set_only_sites(None)
     html.live.set_prepend_site(False)
     html.live.set_limit() # removes limit
 
-    if merge_column:
-        data = merge_data(data, columns)
-
-    # convert lists-rows into dictionaries.
-    # performance, but makes live much easier later.
-    columns = ["site"] + columns + add_columns
-    rows = [ dict(zip(columns, row)) for row in data ]
+    if config.debug_livestatus_queries and config.is_multisite() \
+            and html.output_format == "html" and 'W' in html.display_options:
+        times = [ "%s: %.3f sec" % (sitename, stats["last"])
+                  for sitename, stats in html.live.site_statistics().items() ]
+        html.write('<div class="livestatus message" onmouseover="this.style.display=\'none\';">'
+                   '<tt>%s</tt></div>\n' % "<br>\n".join(times))
 
     return rows
 
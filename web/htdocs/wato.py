@@ -2436,37 +2436,66 @@ def mode_bulk_inventory(phase):
     elif phase == "action":
         if html.var("_item"):
             how = html.var("how")
-            try:
-                folderpath, hostname = html.var("_item").split("|")
+            # The progress sends several hosts at once (separated by
+            # newlines). The hosts of one site are inventorized in
+            # parallel by one automation call.
+            entries = []
+            hosts_of_site = {}
+            for item in html.var("_item").split("\n"):
+                folderpath, hostname = item.split("|")
                 folder = g_folders[folderpath]
                 load_hosts(folder)
                 host = folder[".hosts"][hostname]
-                eff = effective_attributes(host, folder)
-                site_id = eff.get("site")
-                counts = check_mk_automation(site_id, "inventory", [how, hostname])
-                #counts = ( 1, 2, 3, 4 )
-                result = repr([ 'continue', 1, 0 ] + list(counts)) + "\n"
-                result += _("Inventorized %s<br>\n") % hostname
-                mark_affected_sites_dirty(folder, hostname, sync=False, restart=True)
-                log_pending(AFFECTED, hostname, "bulk-inventory",
-                    _("Inventorized host: %d added, %d removed, %d kept, %d total services") % counts)
-                if "inventory_failed" in host:
-                    del host["inventory_failed"]
-                    save_hosts(folder) # Could be optimized, but difficult here
+                site_id = effective_attributes(host, folder).get("site")
+                entries.append((folder, hostname, host, site_id))
+                hosts_of_site.setdefault(site_id, []).append(hostname)
 
-            except Exception, e:
-                result = repr([ 'failed', 1, 1, 0, 0, 0, 0, ]) + "\n"
-                if site_id:
-                    msg = _("Error during inventory of %s on site %s: %s") % (hostname, site_id, e)
+            results = {}
+            for site_id, hostnames in hosts_of_site.items():
+                try:
+                    answer = check_mk_automation(site_id, "inventory", [how] + hostnames)
+                    if len(hostnames) == 1:
+                        answer = { hostnames[0] : answer }
+                    results.update(answer)
+                except Exception, e:
+                    msg = str(e)
+                    if config.debug:
+                        msg += "<br><pre>%s</pre>" % format_exception().replace("\n", "<br>")
+                    for hostname in hostnames:
+                        results[hostname] = msg
+
+            headers = []
+            log = ""
+            changed_folders = {}
+            for folder, hostname, host, site_id in entries:
+                counts = results.get(hostname, _("No result from inventory"))
+                if type(counts) == tuple:
+                    headers.append([ 'continue', 1, 0 ] + list(counts))
+                    log += _("Inventorized %s<br>\n") % hostname
+                    mark_affected_sites_dirty(folder, hostname, sync=False, restart=True)
+                    log_pending(AFFECTED, hostname, "bulk-inventory",
+                        _("Inventorized host: %d added, %d removed, %d kept, %d total services") % counts)
+                    if "inventory_failed" in host:
+                        del host["inventory_failed"]
+                        changed_folders[folder[".path"]] = folder
                 else:
-                    msg = _("Error during inventory of %s: %s") % (hostname, e)
-                if config.debug:
-                    msg += "<br><pre>%s</pre>" % format_exception().replace("\n", "<br>")
-                result += msg + "\n<br>"
-                if not host.get("inventory_failed"):
-                    host["inventory_failed"] = True
-                    save_hosts(folder)
-            html.write(result)
+                    headers.append([ 'failed', 1, 1, 0, 0, 0, 0, ])
+                    if site_id:
+                        msg = _("Error during inventory of %s on site %s: %s") % (hostname, site_id, counts)
+                    else:
+                        msg = _("Error during inventory of %s: %s") % (hostname, counts)
+                    log += msg + "\n<br>"
+                    if not host.get("inventory_failed"):
+                        host["inventory_failed"] = True
+                        changed_folders[folder[".path"]] = folder
+
+            for folder in changed_folders.values():
+                save_hosts(folder)
+
+            if len(headers) == 1:
+                html.write(repr(headers[0]) + "\n" + log)
+            else:
+                html.write(repr(headers) + "\n" + log)
             return ""
         return
 
@@ -2526,6 +2555,7 @@ def mode_bulk_inventory(phase):
               (_("Total services"),   0) ], # stats table
             [ ("mode", "folder") ], # URL for "Stop/Finish" button
             50, # ms to sleep between two steps
+            bulk_size = 10, # hosts inventorized in parallel in one step
         )
 
     else:
@@ -4015,7 +4045,7 @@ def hilite_errors(outdata):
 #   | buttons for aborting and pausing.                                    |
 #   '----------------------------------------------------------------------'
 
-def interactive_progress(items, title, stats, finishvars, timewait, success_stats = [], termvars = []):
+def interactive_progress(items, title, stats, finishvars, timewait, success_stats = [], termvars = [], bulk_size = 1):
     if not termvars:
         termvars = finishvars;
     html.write("<center>")
@@ -4053,9 +4083,9 @@ def interactive_progress(items, title, stats, finishvars, timewait, success_stat
     finish_url = make_link([("mode", "folder")] + finishvars)
     term_url = make_link([("mode", "folder")] + termvars)
 
-    html.javascript(('progress_scheduler("%s", "%s", 50, %s, "%s", %s, "%s", "' + _("FINISHED.") + '");') %
+    html.javascript(('progress_scheduler("%s", "%s", 50, %s, "%s", %s, "%s", "' + _("FINISHED.") + '", %d);') %
                      (html.var('mode'), base_url, json_items, finish_url,
-                      success_stats, term_url))
+                      success_stats, term_url, bulk_size))
 
 
 #.
@@ -36,6 +36,7 @@ import weblib
 import dashboard
 import login
 import help
+import livecache
 
 # map URLs to page rendering functions
 
@@ -74,5 +75,6 @@ pagehandlers.update({
    "dashlet_servicestats"     : dashboard.dashlet_servicestats,
    "dashlet_pnpgraph"         : dashboard.dashlet_pnpgraph,
    "dashlet_nodata"           : dashboard.dashlet_nodata,
+   "livestatus_cache"         : livecache.page_statistics,
 })
 
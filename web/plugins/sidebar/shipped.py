@@ -288,7 +288,11 @@ def render_hostmatrix():
             "Columns: name state has_been_checked worst_service_state scheduled_downtime_depth\n" \
             "Filter: custom_variable_names < _REALNAME\n" \
             "Limit: 901\n"
-    hosts = html.live.query(query)
+    html.live.set_cache_ttl(5)
+    try:
+        hosts = html.live.query(query)
+    finally:
+        html.live.set_cache_ttl()
     html.live.set_prepend_site(False)
     hosts.sort()
     if len(hosts) > 900:
@@ -497,12 +501,16 @@ def render_tactical_overview():
 
     # ACHTUNG: Stats-Filter so anpassen, dass jeder Host gezaehlt wird.
 
+    html.live.set_cache_ttl(5)
     try:
-        hstdata = html.live.query_summed_stats(host_query)
-        svcdata = html.live.query_summed_stats(service_query)
-    except livestatus.MKLivestatusNotFoundError:
-        html.write("<center>No data from any site</center>")
-        return
+        try:
+            hstdata = html.live.query_summed_stats(host_query)
+            svcdata = html.live.query_summed_stats(service_query)
+        except livestatus.MKLivestatusNotFoundError:
+            html.write("<center>No data from any site</center>")
+            return
+    finally:
+        html.live.set_cache_ttl()
     html.write("<table class=\"content_center tacticaloverview\" cellspacing=2 cellpadding=0 border=0>\n")
     for title, data, view, what in [
             (_("Hosts"),    hstdata, 'hostproblems', 'host'),
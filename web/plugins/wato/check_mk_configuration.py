@@ -82,6 +82,35 @@ register_configvar(group,
              default_value = True),
     domain = "multisite")
 
+register_configvar(group,
+    "livestatus_query_timeout",
+    Optional(
+        Float(
+            title = _("timeout"),
+            minvalue = 0.1,
+            default_value = 10.0,
+            unit = "sec",
+            display_format = "%.1f"),
+        title = _("Timeout for Livestatus queries"),
+        label = _("Limit the time sites have for answering a query"),
+        help = _("In a multi site setup Multisite queries all sites in parallel. With this "
+                 "option turned on, sites that have not sent their complete answer within "
+                 "this time are regarded as dead and the page is being displayed with the "
+                 "data of the other sites.")),
+    domain = "multisite")
+
+register_configvar(group,
+    "livestatus_query_cache",
+    Checkbox(title = _("Cache for Livestatus queries"),
+             label = _("share results of frequent queries"),
+             help = _("The site status, sidebar snapins and dashboards send the same Livestatus "
+                      "queries with each page and refresh of every user. With the cache enabled "
+                      "their results are shared between all users with the same permissions for "
+                      "a few seconds. This reduces the load on the monitoring cores. The statistics "
+                      "of the cache are shown on the page <tt>livestatus_cache.py</tt>."),
+             default_value = False),
+    domain = "multisite")
+
 register_configvar(group,
     "enable_sounds",
     Checkbox(title = _("Enabled sounds in views"),